@@ -8,13 +8,41 @@ import asyncio
 
 import tornado.ioloop
 import tornado.web
+import tornado.httputil
+import tornado.locks
 import socket
 import tornado.websocket
 import shutil
-from collections import deque
+import hashlib
+import sqlite3
+import gzip
+import io
+import stat
+import struct
+import ctypes
+import ctypes.util
+import heapq
+import itertools
+import tarfile
+import zipfile
+import threading
+import time
+import atexit
+import re
+import glob
+import fnmatch
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque, Counter, OrderedDict
 from ldap3 import Server, Connection, ALL
 from datetime import datetime
 
+from .sync import block_checksums, MIN_BLOCK_SIZE, MAX_BLOCK_SIZE, DEFAULT_BLOCK_SIZE, MAX_RANGES
+
+try:
+    import zstandard
+except ImportError:  # optional: only needed to read .zst files
+    zstandard = None
+
 
 def join_path(*parts):
     return os.path.join(*parts).replace("\\", "/")
@@ -35,25 +63,92 @@ FEATURE_FLAGS = {
     "file_edit": True,
 }
 
+# Concurrency limits per request class, editable from the admin panel. 0 means unlimited.
+# "total" caps all classes together; bulk classes may not use the last
+# "interactive_reserve" of those slots, so listings stay responsive.
+ADMISSION_LIMITS = {
+    "total": 64,
+    "interactive_reserve": 8,
+    "queue_size": 128,
+    "queue_timeout": 30,
+    "listing_per_user": 16,
+    "listing_global": 0,
+    "filter_per_user": 2,
+    "filter_global": 8,
+    "stream_per_user": 8,
+    "stream_global": 32,
+    "upload_per_user": 4,
+    "upload_global": 16,
+    "download_per_user": 4,
+    "download_global": 32,
+}
+
+# Lower values are admitted first when slots free up
+ADMISSION_PRIORITY = {"listing": 0, "filter": 1, "stream": 2, "upload": 3, "download": 3}
+INTERACTIVE_CLASSES = ("listing", "filter")
+ADMISSION_RETRY_AFTER = 5
+
 MAX_FILE_SIZE = 10 * 1024 * 1024
 MAX_READABLE_FILE_SIZE = 10 * 1024 * 1024
 CHUNK_SIZE = 1024 * 64
+# Most bytes a file stream reads per poll; the rest is picked up on the next one
+TAIL_READ_LIMIT = 1024 * 1024
 
 SHARES = {}
 
+HASH_ALGORITHMS = ("sha256", "blake2b")
+# SHA-256 by default since it is the one browsers can compute (SubtleCrypto)
+DEFAULT_HASH_ALGORITHM = "sha256"
+HASH_CACHE_PATH = os.path.join(os.path.expanduser("~"), ".aird", "hash_cache.sqlite3")
+HASH_READ_SIZE = 1024 * 1024
+HASH_WORKERS = max(1, min(4, os.cpu_count() or 1))
+
+AUDIT_LOG_DIR = os.path.join(os.path.expanduser("~"), ".aird", "audit")
+AUDIT_QUEUE_SIZE = 100000
+AUDIT_BATCH_SIZE = 512
+AUDIT_FLUSH_INTERVAL = 1.0
+AUDIT_MAX_BYTES = 50 * 1024 * 1024
+AUDIT_BACKUP_COUNT = 10
+# "always": fsync every batch, "interval": at most every AUDIT_FSYNC_INTERVAL seconds, "never"
+AUDIT_FSYNC = "interval"
+AUDIT_FSYNC_INTERVAL = 5.0
+# Recent events kept in memory for the admin query API
+AUDIT_RECENT = 10000
+
+ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+# Number of archive member indexes kept in memory
+ARCHIVE_CACHE_SIZE = 32
+
+# Merged tail streams: files per stream, how long lines wait to be put in timestamp
+# order, how many may wait at most, and how many history lines each file starts with
+MULTI_TAIL_MAX_FILES = 64
+MULTI_TAIL_REORDER_WINDOW = 1.0
+MULTI_TAIL_MAX_BUFFER = 10000
+MULTI_TAIL_HISTORY = 20
+# Directories watched for new files per stream when a glob uses **
+MULTI_TAIL_MAX_WATCHES = 256
+LOG_TIMESTAMP = re.compile(r"(\d{4}-\d{2}-\d{2})[T ](\d{2}:\d{2}:\d{2})(?:[.,](\d{1,6}))?")
+
+# Directory change events are collected for this long before being pushed
+WATCH_DEBOUNCE = 0.25
+# Fallback scan interval where inotify is not available
+WATCH_POLL_INTERVAL = 2.0
+
+def format_file_info(name, is_dir, size, mtime):
+    return {
+        "name": name,
+        "is_dir": is_dir,
+        "size_bytes": size,
+        "size_str": f"{size / 1024:.2f} KB" if not is_dir else "-",
+        "modified": datetime.fromtimestamp(mtime).strftime('%Y-%m-%d %H:%M:%S'),
+        "modified_timestamp": int(mtime)
+    }
+
+def get_file_info(name, st):
+    return format_file_info(name, stat.S_ISDIR(st.st_mode), st.st_size, st.st_mtime)
+
 def get_files_in_directory(path="."):
-    files = []
-    for entry in os.scandir(path):
-        stat = entry.stat()
-        files.append({
-            "name": entry.name,
-            "is_dir": entry.is_dir(),
-            "size_bytes": stat.st_size,
-            "size_str": f"{stat.st_size / 1024:.2f} KB" if not entry.is_dir() else "-",
-            "modified": datetime.fromtimestamp(stat.st_mtime).strftime('%Y-%m-%d %H:%M:%S'),
-            "modified_timestamp": int(stat.st_mtime)
-        })
-    return files
+    return [get_file_info(entry.name, entry.stat()) for entry in os.scandir(path)]
 
 def get_file_icon(filename):
     ext = os.path.splitext(filename)[1].lower()
@@ -63,12 +158,833 @@ def get_file_icon(filename):
         return "🖼️"
     elif ext in [".py", ".js", ".java", ".cpp"]:
         return "💻"
-    elif ext in [".zip", ".rar"]:
+    elif ext == ".rar" or is_archive(filename):
         return "🗜️"
     else:
         return "📦"
 
 
+def hash_file(path, algorithm=DEFAULT_HASH_ALGORITHM):
+    """Stream a file through the given hash algorithm and return the hex digest.
+
+    Runs inside the hash process pool, so it must stay a picklable top-level function.
+    """
+    h = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(HASH_READ_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+def file_identity(st):
+    """Cache key for a stat result: content is assumed unchanged while these match."""
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+
+def temp_path_for(path):
+    """A hidden, unique name in the same directory, so os.replace() stays atomic."""
+    directory, name = os.path.split(path)
+    return os.path.join(directory, f".{name}.{secrets.token_hex(4)}.tmp")
+
+def replace_file(path, data):
+    """Write data to a temporary file and rename it over path.
+
+    Files are never rewritten in place: upload dedup may have hardlinked the
+    same inode into other paths, which must keep their old content.
+    """
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666
+    tmp = temp_path_for(path)
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, mode)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+def link_or_copy(source, target, allow_link=True):
+    """Place source's content at target: hardlinked if allowed and possible, else copied.
+
+    The new entry is created under a temporary name and renamed over target, so
+    an existing target is never left missing or half written. Returns the method used.
+    """
+    tmp = temp_path_for(target)
+    try:
+        method = None
+        if allow_link:
+            try:
+                os.link(source, tmp)
+                method = "hardlink"
+            except OSError:
+                pass
+        if method is None:
+            shutil.copy2(source, tmp)
+            method = "copy"
+        os.replace(tmp, target)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+    return method
+
+class HashCache:
+    """Persistent content hash cache keyed by device/inode/size/mtime.
+
+    Digests are computed in a process pool and stored in SQLite together with the
+    path they were computed for, so they survive restarts and can be looked up by
+    digest to find existing copies of some content. The cache also remembers
+    which file versions aird wrote itself (record_write), as only those are safe
+    to share through a hardlink.
+    """
+
+    def __init__(self, path=HASH_CACHE_PATH):
+        self.path = path
+        self._db = None
+        self._executor = None
+        self._pending = {}
+
+    def _conn(self):
+        if self._db is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._db = sqlite3.connect(self.path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS hashes ("
+                "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, "
+                "algorithm TEXT, digest TEXT, path TEXT, "
+                "PRIMARY KEY (dev, ino, size, mtime_ns, algorithm))"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS hashes_digest ON hashes (algorithm, digest)")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS blocks ("
+                "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, "
+                "block_size INTEGER, checksums TEXT, "
+                "PRIMARY KEY (dev, ino, size, mtime_ns, block_size))"
+            )
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS written ("
+                "dev INTEGER, ino INTEGER, size INTEGER, mtime_ns INTEGER, "
+                "PRIMARY KEY (dev, ino))"
+            )
+            self._db.commit()
+        return self._db
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=HASH_WORKERS)
+        return self._executor
+
+    def get_cached(self, path, algorithm=DEFAULT_HASH_ALGORITHM):
+        """Return the cached digest for path, or None if it has not been hashed yet."""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        row = self._conn().execute(
+            "SELECT digest FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND algorithm=?",
+            file_identity(st) + (algorithm,),
+        ).fetchone()
+        return row[0] if row else None
+
+    async def get(self, path, algorithm=DEFAULT_HASH_ALGORITHM):
+        """Return the digest for path, hashing it in the process pool on a cache miss."""
+        st = os.stat(path)
+        key = file_identity(st) + (algorithm,)
+        digest = self.get_cached(path, algorithm)
+        if digest:
+            return digest
+        digest = await self._compute(key, hash_file, path, algorithm)
+        # Only trust the result if the file did not change while it was being read
+        if file_identity(os.stat(path)) == key[:4]:
+            self._conn().execute(
+                "INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?, ?, ?, ?)",
+                key + (digest, path),
+            )
+            self._conn().commit()
+        return digest
+
+    async def _compute(self, key, fn, *args):
+        # Concurrent requests for the same file version share one job
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._pool(), fn, *args)
+            self._pending[key] = future
+        try:
+            return await future
+        finally:
+            self._pending.pop(key, None)
+
+    async def blocks(self, path, block_size=DEFAULT_BLOCK_SIZE):
+        """Return per-block [weak, strong] checksums for the current version of path."""
+        identity = file_identity(os.stat(path))
+        db = self._conn()
+        row = db.execute(
+            "SELECT checksums FROM blocks WHERE dev=? AND ino=? AND size=? AND mtime_ns=? AND block_size=?",
+            identity + (block_size,),
+        ).fetchone()
+        if row:
+            return json.loads(row[0])
+        checksums = await self._compute(identity + (("blocks", block_size),), block_checksums, path, block_size)
+        if file_identity(os.stat(path)) == identity:
+            # Older versions of the same file are of no further use
+            db.execute("DELETE FROM blocks WHERE dev=? AND ino=? AND block_size=?", (identity[0], identity[1], block_size))
+            db.execute("INSERT INTO blocks VALUES (?, ?, ?, ?, ?, ?)", identity + (block_size, json.dumps(checksums)))
+            db.commit()
+        return checksums
+
+    def record_write(self, path):
+        """Remember that aird wrote this version of path itself."""
+        db = self._conn()
+        db.execute("INSERT OR REPLACE INTO written VALUES (?, ?, ?, ?)", file_identity(os.stat(path)))
+        db.commit()
+
+    def is_own_write(self, path):
+        """True if path is still exactly the version aird wrote.
+
+        Anything else, such as a log another process appends to, may change in
+        place and would change every hardlinked copy with it.
+        """
+        try:
+            identity = file_identity(os.stat(path))
+        except OSError:
+            return False
+        row = self._conn().execute(
+            "SELECT size, mtime_ns FROM written WHERE dev=? AND ino=?", identity[:2]
+        ).fetchone()
+        return row is not None and tuple(row) == identity[2:]
+
+    def schedule(self, path, algorithm=DEFAULT_HASH_ALGORITHM):
+        """Hash path in the background so later requests hit the cache."""
+        async def _run():
+            try:
+                await self.get(path, algorithm)
+            except Exception as e:
+                logging.warning("Background hashing of %s failed: %s", path, e)
+        tornado.ioloop.IOLoop.current().spawn_callback(_run)
+
+    def find(self, digest, algorithm=DEFAULT_HASH_ALGORITHM, size=None):
+        """Return the path of a file under ROOT_DIR whose content has this digest.
+
+        Stale rows (file gone or modified since it was hashed) are dropped.
+        """
+        db = self._conn()
+        rows = db.execute(
+            "SELECT dev, ino, size, mtime_ns, path FROM hashes WHERE algorithm=? AND digest=?",
+            (algorithm, digest),
+        ).fetchall()
+        for dev, ino, row_size, mtime_ns, path in rows:
+            if size is not None and row_size != size:
+                continue
+            try:
+                st = os.stat(path)
+            except OSError:
+                st = None
+            if st is None or file_identity(st) != (dev, ino, row_size, mtime_ns):
+                db.execute(
+                    "DELETE FROM hashes WHERE dev=? AND ino=? AND size=? AND mtime_ns=?",
+                    (dev, ino, row_size, mtime_ns),
+                )
+                db.execute(
+                    "DELETE FROM written WHERE dev=? AND ino=? AND size=? AND mtime_ns=?",
+                    (dev, ino, row_size, mtime_ns),
+                )
+                db.commit()
+                continue
+            if os.path.abspath(path).startswith(ROOT_DIR):
+                return path
+        return None
+
+HASH_CACHE = HashCache()
+
+def is_archive(path):
+    return path.lower().endswith(ARCHIVE_EXTENSIONS)
+
+def split_archive_path(abspath):
+    """Split a path that points into an archive into (archive, member).
+
+    Returns (abspath, "") for an archive file itself and (None, None) when no
+    archive file is part of the path.
+    """
+    candidate, parts = abspath, []
+    while candidate.startswith(ROOT_DIR) and candidate != ROOT_DIR:
+        if os.path.isfile(candidate):
+            if is_archive(candidate):
+                return candidate, "/".join(reversed(parts))
+            return None, None
+        if os.path.isdir(candidate):
+            return None, None
+        candidate, part = os.path.split(candidate)
+        parts.append(part)
+    return None, None
+
+def build_archive_index(path):
+    """Read an archive's member list once: the central directory of a zip, or
+    every header of a tar. Runs off the IOLoop."""
+    members = {}
+    index = {"path": path, "members": members, "children": {"": set()}, "zip": None, "users": 0, "evicted": False}
+    archive_mtime = os.path.getmtime(path)
+    if path.lower().endswith(".zip"):
+        zf = zipfile.ZipFile(path)
+        index["zip"] = zf
+        for info in zf.infolist():
+            try:
+                mtime = datetime(*info.date_time).timestamp()
+            except ValueError:
+                mtime = archive_mtime
+            members[info.filename] = {
+                "is_dir": info.is_dir(),
+                "size": info.file_size,
+                "mtime": mtime,
+                "info": info,
+            }
+    else:
+        with tarfile.open(path) as tf:
+            for info in tf:
+                if not (info.isfile() or info.isdir()):
+                    continue
+                members[info.name] = {
+                    "is_dir": info.isdir(),
+                    "size": info.size,
+                    "mtime": info.mtime,
+                    "info": info,
+                }
+    normalized = {}
+    for name, member in members.items():
+        name = name.strip("/")
+        if name.startswith("./"):
+            name = name[2:]
+        if not name or name == ".":
+            continue
+        normalized[name] = member
+        # Zips often omit directory entries, so every parent directory is implied
+        parent, _, child = name.rpartition("/")
+        index["children"].setdefault(parent, set()).add(child)
+        if member["is_dir"]:
+            index["children"].setdefault(name, set())
+        while parent:
+            grandparent, _, dirname = parent.rpartition("/")
+            index["children"].setdefault(grandparent, set()).add(dirname)
+            normalized.setdefault(parent, {"is_dir": True, "size": 0, "mtime": archive_mtime, "info": None})
+            parent = grandparent
+    index["members"] = normalized
+    return index
+
+class ArchiveIndexCache:
+    """LRU cache of archive member indexes keyed by path and inode/size/mtime.
+
+    Every get() must be paired with release(): an evicted zip is only closed
+    once no request is still using its index.
+    """
+
+    def __init__(self, size=ARCHIVE_CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+
+    async def get(self, path):
+        key = (path,) + file_identity(os.stat(path))
+        index = self.entries.get(key)
+        if index is not None:
+            self.entries.move_to_end(key)
+            index["users"] += 1
+            return index
+        loop = tornado.ioloop.IOLoop.current()
+        index = await loop.run_in_executor(None, build_archive_index, path)
+        # The archive was replaced: its old index can never be hit again
+        for stale in [k for k in self.entries if k[0] == path]:
+            self._close(self.entries.pop(stale))
+        self.entries[key] = index
+        while len(self.entries) > self.size:
+            _key, old = self.entries.popitem(last=False)
+            self._close(old)
+        index["users"] += 1
+        return index
+
+    def release(self, index):
+        index["users"] -= 1
+        if index["evicted"] and not index["users"]:
+            self._close(index)
+
+    @staticmethod
+    def _close(index):
+        index["evicted"] = True
+        # Members still being read keep the zip's file open until they are closed
+        if index["zip"] is not None and not index["users"]:
+            index["zip"].close()
+
+ARCHIVE_INDEX = ArchiveIndexCache()
+
+def list_archive_directory(index, member):
+    files = []
+    for name in sorted(index["children"].get(member, ())):
+        full = f"{member}/{name}" if member else name
+        entry = index["members"][full]
+        files.append(format_file_info(name, entry["is_dir"], entry["size"], entry["mtime"]))
+    return files
+
+def read_file_text(path, filter_substring=None):
+    """Read a file for preview: the lines containing filter_substring, or the
+    whole file (at most MAX_READABLE_FILE_SIZE characters of a compressed one).
+    Runs off the IOLoop."""
+    if filter_substring:
+        with open_text(path) as f:
+            return ''.join([line for line in f if filter_substring in line])
+    if is_compressed(path):
+        # The decompressed size is unknown up front, so cap what we render
+        with open_text(path) as f:
+            content = f.read(MAX_READABLE_FILE_SIZE)
+            if f.read(1):
+                content += "\n[... truncated, use the filter or stream to see more ...]\n"
+            return content
+    with open(path, 'r', encoding='utf-8', errors='replace') as f:
+        return f.read()
+
+def read_archive_text(reader, filter_substring=None):
+    """Decode an archive member for preview: the lines containing filter_substring,
+    or the first MAX_READABLE_FILE_SIZE characters. Runs off the IOLoop."""
+    with reader as raw:
+        text = io.TextIOWrapper(raw, encoding='utf-8', errors='replace')
+        if filter_substring:
+            return ''.join([line for line in text if filter_substring in line])
+        content = text.read(MAX_READABLE_FILE_SIZE)
+        if text.read(1):
+            content += "\n[... truncated, download the file to see more ...]\n"
+        return content
+
+def open_archive_member(index, member):
+    """Open one archive member for binary reading without extracting the rest.
+
+    Zip members and members of uncompressed tars are read from their own offset;
+    compressed tars have to be decompressed up to the member, so the returned
+    reader must only be used off the IOLoop.
+    """
+    info = index["members"][member]["info"]
+    if index["zip"] is not None:
+        return index["zip"].open(info)
+    tf = tarfile.open(index["path"])
+    reader = tf.extractfile(info)
+    # Closing the member reader should also release the archive handle
+    original_close = reader.close
+    def close():
+        original_close()
+        tf.close()
+    reader.close = close
+    return reader
+
+COMPRESSED_EXTENSIONS = (".gz", ".zst")
+
+def is_compressed(path):
+    return path.lower().endswith(COMPRESSED_EXTENSIONS)
+
+def open_text(path):
+    """Open a file for reading text, decompressing .gz/.zst on the fly."""
+    lower = path.lower()
+    if lower.endswith(".gz"):
+        return gzip.open(path, 'rt', encoding='utf-8', errors='replace')
+    if lower.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError("Reading .zst files requires the 'zstandard' package")
+        reader = zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8', errors='replace')
+    return open(path, 'r', encoding='utf-8', errors='replace')
+
+def read_last_lines(path, count, end=None):
+    """Return the last count lines of a file without their newlines.
+
+    Plain files are read backwards from end (default: the end of the file);
+    compressed ones can only be decompressed from the start. Blocks on I/O, so
+    run it in an executor.
+    """
+    if is_compressed(path):
+        with open_text(path) as f:
+            return [line.rstrip("\n") for line in deque(f, count)]
+    with open(path, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END) if end is None else end
+        data = b""
+        # One newline more than needed so the first line kept is complete
+        while pos > 0 and data.count(b"\n") <= count:
+            step = min(CHUNK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            data = f.read(step) + data
+    lines = data.decode('utf-8', errors='replace').splitlines()
+    return lines[-count:] if count else []
+
+def parse_byte_ranges(header, size):
+    """Parse a `Range: bytes=...` header into merged, inclusive (start, end) pairs.
+
+    Returns None when the header is absent or invalid, e.g. `bytes=5-3` (RFC 9110
+    says to ignore it and serve the whole file), and an empty list when it is
+    valid but no range is satisfiable.
+    """
+    if not header or not header.startswith("bytes="):
+        return None
+    ranges = []
+    for spec in header[len("bytes="):].split(","):
+        first, sep, last = spec.strip().partition("-")
+        if not sep or not (first or last):
+            return None
+        if not all(part.isascii() and part.isdigit() for part in (first, last) if part):
+            return None
+        if first:
+            start = int(first)
+            if last and int(last) < start:
+                return None
+            end = min(int(last), size - 1) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1 if int(last) else -1
+        if start <= end and start < size:
+            ranges.append((start, end))
+    ranges.sort()
+    merged = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def strong_etag(digest, algorithm=DEFAULT_HASH_ALGORITHM):
+    return f'"{algorithm}-{digest}"'
+
+def is_valid_digest(digest, algorithm):
+    if algorithm not in HASH_ALGORITHMS or not isinstance(digest, str):
+        return False
+    expected = hashlib.new(algorithm).digest_size * 2
+    return len(digest) == expected and all(c in "0123456789abcdef" for c in digest)
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, retry_after=ADMISSION_RETRY_AFTER):
+        super().__init__(reason)
+        self.retry_after = retry_after
+
+class AdmissionController:
+    """Counts active requests per class and per user and queues the excess.
+
+    Requests that cannot start immediately wait in a bounded queue ordered by
+    ADMISSION_PRIORITY; when the queue is full, or a request waits longer than
+    queue_timeout, AdmissionRejected is raised.
+    """
+
+    def __init__(self, limits):
+        self.limits = limits
+        self.active = Counter()        # kind -> count
+        self.active_users = Counter()  # (kind, user) -> count
+        self.total = 0
+        self.waiters = []              # heap of (priority, seq, kind, user, future)
+        self._seq = itertools.count()
+        self.stats = {kind: Counter() for kind in ADMISSION_PRIORITY}
+
+    def _fits(self, kind, user):
+        limits = self.limits
+        per_user = limits.get(f"{kind}_per_user", 0)
+        per_class = limits.get(f"{kind}_global", 0)
+        total = limits.get("total", 0)
+        if per_user and self.active_users[(kind, user)] >= per_user:
+            return False
+        if per_class and self.active[kind] >= per_class:
+            return False
+        if total:
+            if kind not in INTERACTIVE_CLASSES:
+                total -= limits.get("interactive_reserve", 0)
+            if self.total >= total:
+                return False
+        return True
+
+    @staticmethod
+    def validate(limits):
+        """Return why a set of limits is unusable, or None if it is fine."""
+        total = limits.get("total", 0)
+        if total and limits.get("interactive_reserve", 0) >= total:
+            return "interactive_reserve must be smaller than total, or bulk requests could never start"
+        return None
+
+    def _admit(self, kind, user):
+        self.active[kind] += 1
+        self.active_users[(kind, user)] += 1
+        self.total += 1
+        self.stats[kind]["admitted"] += 1
+
+    async def acquire(self, kind, user):
+        if self._fits(kind, user):
+            self._admit(kind, user)
+            return
+        queue_size = self.limits.get("queue_size", 0)
+        if queue_size and len(self.waiters) >= queue_size:
+            self.stats[kind]["rejected"] += 1
+            raise AdmissionRejected("Server busy: too many queued requests")
+        future = asyncio.get_running_loop().create_future()
+        entry = (ADMISSION_PRIORITY[kind], next(self._seq), kind, user, future)
+        heapq.heappush(self.waiters, entry)
+        self.stats[kind]["queued"] += 1
+        try:
+            # The slot is taken on our behalf by wake() before the future resolves
+            await asyncio.wait_for(asyncio.shield(future), self.limits.get("queue_timeout") or None)
+        except asyncio.TimeoutError:
+            if future.done():
+                return
+            future.cancel()
+            self.waiters.remove(entry)
+            heapq.heapify(self.waiters)
+            self.stats[kind]["rejected"] += 1
+            raise AdmissionRejected("Server busy: timed out waiting for a free slot")
+
+    def release(self, kind, user):
+        self.active[kind] -= 1
+        self.active_users[(kind, user)] -= 1
+        if not self.active_users[(kind, user)]:
+            del self.active_users[(kind, user)]
+        self.total -= 1
+        self.wake()
+
+    def wake(self):
+        """Admit queued requests, highest priority first, that now fit the limits."""
+        remaining = []
+        for entry in sorted(self.waiters):
+            _priority, _seq, kind, user, future = entry
+            if future.done():
+                continue
+            if self._fits(kind, user):
+                self._admit(kind, user)
+                future.set_result(None)
+            else:
+                remaining.append(entry)
+        heapq.heapify(remaining)
+        self.waiters = remaining
+
+    def metrics(self):
+        waiting = Counter(kind for _p, _s, kind, _u, future in self.waiters if not future.done())
+        return {
+            "limits": dict(self.limits),
+            "total_active": self.total,
+            "classes": {
+                kind: {
+                    "active": self.active[kind],
+                    "waiting": waiting[kind],
+                    "admitted": self.stats[kind]["admitted"],
+                    "queued": self.stats[kind]["queued"],
+                    "rejected": self.stats[kind]["rejected"],
+                }
+                for kind in ADMISSION_PRIORITY
+            },
+            "users": [
+                {"class": kind, "user": user, "active": count}
+                for (kind, user), count in sorted(self.active_users.items())
+            ],
+        }
+
+ADMISSION = AdmissionController(ADMISSION_LIMITS)
+
+class AdmissionMixin:
+    """Request handler helpers to hold admission slots for the request's lifetime."""
+
+    def admission_user(self):
+        user = self.get_current_user()
+        if isinstance(user, bytes):
+            user = user.decode()
+        # Token logins all share one cookie value, so tell them apart by address
+        if not user or user == "authenticated":
+            return self.request.remote_ip
+        return user
+
+    async def acquire_slot(self, kind):
+        """Take a slot of the given class, or answer 503 and return False."""
+        user = self.admission_user()
+        try:
+            await ADMISSION.acquire(kind, user)
+        except AdmissionRejected as e:
+            self.set_status(503)
+            self.set_header("Retry-After", str(e.retry_after))
+            self.finish(str(e))
+            return False
+        if not hasattr(self, "_admission_slots"):
+            self._admission_slots = []
+        self._admission_slots.append((kind, user))
+        return True
+
+    def release_slots(self):
+        for kind, user in getattr(self, "_admission_slots", []):
+            ADMISSION.release(kind, user)
+        self._admission_slots = []
+
+    def on_finish(self):
+        self.release_slots()
+
+    def on_connection_close(self):
+        self.release_slots()
+        super().on_connection_close()
+
+
+class AuditLog:
+    """Structured audit trail of file operations.
+
+    record() only appends to an in-memory deque and updates the recent-event
+    indexes, so it is cheap on the IOLoop. A background thread drains the deque
+    in batches into rotating JSON-lines files, flushing when a batch fills up or
+    AUDIT_FLUSH_INTERVAL passes, and fsyncs according to the fsync policy.
+    """
+
+    def __init__(self):
+        self.directory = None
+        self.queue = deque()
+        self.dropped = 0
+        self.written = 0
+        self.recent = deque(maxlen=AUDIT_RECENT)
+        self.by_user = {}
+        self.by_action = {}
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._file = None
+        self._last_fsync = 0.0
+        self._unsynced = False
+        self.fsync = AUDIT_FSYNC
+
+    def start(self, directory=AUDIT_LOG_DIR, fsync=AUDIT_FSYNC):
+        self.directory = directory
+        self.fsync = fsync
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="aird-audit", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def record(self, handler, action, path, **details):
+        user = handler.get_current_user()
+        if isinstance(user, bytes):
+            user = user.decode()
+        event = {
+            "time": datetime.utcnow().isoformat(timespec="milliseconds") + "Z",
+            "user": user or "anonymous",
+            "ip": handler.request.remote_ip,
+            "action": action,
+            "path": path,
+        }
+        event.update((key, value) for key, value in details.items() if value is not None)
+        self.recent.append(event)
+        for index, key in ((self.by_user, event["user"]), (self.by_action, action)):
+            if key not in index:
+                index[key] = deque(maxlen=AUDIT_RECENT)
+            index[key].append(event)
+        if self._thread is None:
+            return
+        if len(self.queue) >= AUDIT_QUEUE_SIZE:
+            self.dropped += 1
+            return
+        self.queue.append(event)
+        if len(self.queue) >= AUDIT_BATCH_SIZE:
+            self._wakeup.set()
+
+    def query(self, user=None, action=None, path=None, limit=100):
+        """Most recent events first, narrowed through the user/action indexes."""
+        if user is not None:
+            events = self.by_user.get(user, ())
+        elif action is not None:
+            events = self.by_action.get(action, ())
+        else:
+            events = self.recent
+        result = []
+        for event in reversed(events):
+            if action is not None and event["action"] != action:
+                continue
+            if path is not None and not event["path"].startswith(path):
+                continue
+            result.append(event)
+            if len(result) >= limit:
+                break
+        return result
+
+    def stats(self):
+        return {"queued": len(self.queue), "written": self.written, "dropped": self.dropped}
+
+    def _path(self):
+        return os.path.join(self.directory, "audit.jsonl")
+
+    def _open(self):
+        self._file = open(self._path(), 'a', encoding='utf-8')
+
+    def _rotate(self):
+        if self._unsynced and self.fsync != "never":
+            self._sync()
+        self._file.close()
+        stamp = datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')
+        os.replace(self._path(), os.path.join(self.directory, f"audit-{stamp}.jsonl"))
+        rotated = sorted(name for name in os.listdir(self.directory)
+                         if name.startswith("audit-") and name.endswith(".jsonl"))
+        for name in rotated[:-AUDIT_BACKUP_COUNT] if AUDIT_BACKUP_COUNT else rotated:
+            os.remove(os.path.join(self.directory, name))
+        self._open()
+
+    def _write_batch(self):
+        lines = []
+        while self.queue and len(lines) < AUDIT_BATCH_SIZE:
+            lines.append(json.dumps(self.queue.popleft()) + "\n")
+        if not lines:
+            return False
+        if self._file is None:
+            self._open()
+        self._file.write("".join(lines))
+        self._file.flush()
+        self._unsynced = True
+        if self.fsync == "always" or self._fsync_due():
+            self._sync()
+        self.written += len(lines)
+        if self._file.tell() >= AUDIT_MAX_BYTES:
+            self._rotate()
+        return True
+
+    def _fsync_due(self):
+        return (self.fsync == "interval" and self._unsynced
+                and time.monotonic() - self._last_fsync >= AUDIT_FSYNC_INTERVAL)
+
+    def _sync(self):
+        os.fsync(self._file.fileno())
+        self._last_fsync = time.monotonic()
+        self._unsynced = False
+
+    def _run(self):
+        while True:
+            timeout = AUDIT_FLUSH_INTERVAL
+            if self.fsync == "interval" and self._unsynced:
+                # Wake up in time to sync the last writes even if no more events come
+                due = self._last_fsync + AUDIT_FSYNC_INTERVAL - time.monotonic()
+                timeout = min(timeout, max(due, 0))
+            self._wakeup.wait(timeout)
+            self._wakeup.clear()
+            try:
+                while self._write_batch():
+                    pass
+                if self._fsync_due():
+                    self._sync()
+            except OSError as e:
+                logging.error("Writing the audit log failed: %s", e)
+            if self._stopping:
+                break
+
+    def close(self):
+        """Write out everything still queued and stop the writer thread."""
+        if self._thread is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        self._thread.join()
+        self._thread = None
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            self._file = None
+
+AUDIT_LOG = AuditLog()
+
+
 class FeatureFlagSocketHandler(tornado.websocket.WebSocketHandler):
     connections: Set['FeatureFlagSocketHandler'] = set()
 
@@ -88,7 +1004,7 @@ class FeatureFlagSocketHandler(tornado.websocket.WebSocketHandler):
             connection.write_message(json.dumps(FEATURE_FLAGS))
 
 
-class BaseHandler(tornado.web.RequestHandler):
+class BaseHandler(AdmissionMixin, tornado.web.RequestHandler):
     def get_current_user(self) -> str | None:
         return self.get_secure_cookie("user")
 
@@ -157,7 +1073,7 @@ class AdminHandler(BaseHandler):
         if not self.get_current_admin():
             self.redirect("/admin/login")
             return
-        self.render("admin.html", features=FEATURE_FLAGS)
+        self.render("admin.html", features=FEATURE_FLAGS, limits=ADMISSION_LIMITS, admission=ADMISSION.metrics())
 
     @tornado.web.authenticated
     def post(self):
@@ -165,16 +1081,63 @@ class AdminHandler(BaseHandler):
             self.set_status(403)
             self.write("Forbidden")
             return
-        
+
+        limits = dict(ADMISSION_LIMITS)
+        for key in limits:
+            value = self.get_argument(key, None)
+            if value is None:
+                continue
+            try:
+                limits[key] = max(0, int(value))
+            except ValueError:
+                pass
+        error = AdmissionController.validate(limits)
+        if error:
+            self.set_status(400)
+            self.write(error)
+            return
+
         FEATURE_FLAGS["file_upload"] = self.get_argument("file_upload", "off") == "on"
         FEATURE_FLAGS["file_delete"] = self.get_argument("file_delete", "off") == "on"
         FEATURE_FLAGS["file_rename"] = self.get_argument("file_rename", "off") == "on"
         FEATURE_FLAGS["file_download"] = self.get_argument("file_download", "off") == "on"
         FEATURE_FLAGS["file_edit"] = self.get_argument("file_edit", "off") == "on"
+
+        ADMISSION_LIMITS.update(limits)
+        # Raised limits may let queued requests start right away
+        ADMISSION.wake()
         
         FeatureFlagSocketHandler.send_updates()
         self.redirect("/admin")
 
+class AdminAuditHandler(BaseHandler):
+    @tornado.web.authenticated
+    def get(self):
+        if not self.get_current_admin():
+            self.set_status(403)
+            self.write({"error": "Forbidden"})
+            return
+        try:
+            limit = max(1, min(int(self.get_argument("limit", 100)), AUDIT_RECENT))
+        except ValueError:
+            limit = 100
+        events = AUDIT_LOG.query(
+            user=self.get_argument("user", None),
+            action=self.get_argument("action", None),
+            path=self.get_argument("path", None),
+            limit=limit,
+        )
+        self.write({"events": events, "log": AUDIT_LOG.stats()})
+
+class AdminMetricsHandler(BaseHandler):
+    @tornado.web.authenticated
+    def get(self):
+        if not self.get_current_admin():
+            self.set_status(403)
+            self.write({"error": "Forbidden"})
+            return
+        self.write({"admission": ADMISSION.metrics(), "audit": AUDIT_LOG.stats()})
+
 def get_relative_path(path, root):
     if path.startswith(root):
         return os.path.relpath(path, root)
@@ -190,6 +1153,22 @@ class MainHandler(BaseHandler):
             self.write("Forbidden")
             return
 
+        kind = "listing"
+        if self.get_argument('download', None):
+            kind = "download"
+        elif self.get_argument('stream', None) is not None:
+            kind = "stream"
+        elif self.get_argument('filter', None):
+            kind = "filter"
+        if not await self.acquire_slot(kind):
+            return
+
+        # Archives are browsed as virtual directories unless downloaded or streamed whole
+        archive, member = split_archive_path(abspath)
+        if archive is not None and (member or kind in ("listing", "filter")):
+            await self.serve_archive(path, archive, member)
+            return
+
         if os.path.isdir(abspath):
             files = get_files_in_directory(abspath)
             parent_path = os.path.dirname(path) if path else None
@@ -211,43 +1190,61 @@ class MainHandler(BaseHandler):
                     self.set_status(403)
                     self.write("File download is disabled.")
                     return
-                self.set_header('Content-Type', 'application/octet-stream')
-                self.set_header('Content-Disposition', f'attachment; filename="{filename}"')
-                with open(abspath, 'rb') as f:
-                    while True:
-                        chunk = f.read(CHUNK_SIZE)
-                        if not chunk:
-                            break
-                        self.write(chunk)
-                        await self.flush()  # Ensure the chunk is sent
+                # Strong ETag from the content hash when we already know it;
+                # otherwise hash in the background so the next request gets one
+                digest = HASH_CACHE.get_cached(abspath)
+                if digest:
+                    self.set_header('ETag', strong_etag(digest))
+                    if self.check_etag_header():
+                        self.set_status(304)
+                        return
+                else:
+                    HASH_CACHE.schedule(abspath)
+                AUDIT_LOG.record(self, "download", path, range=self.request.headers.get('Range'))
+                await self.send_file(abspath, filename, strong_etag(digest) if digest else None)
                 return  # Exit after sending file
             else:
                 # Handle streaming
                 start_streaming = self.get_argument('stream', None) is not None
+                loop = tornado.ioloop.IOLoop.current()
                 if start_streaming:
+                    # Decompression happens in the executor; the first chunk is read
+                    # before the header so a missing zstandard or corrupt file is a 500
+                    f = None
+                    try:
+                        f = open_text(abspath)
+                        chunk = await loop.run_in_executor(None, f.read, CHUNK_SIZE)
+                    except (OSError, EOFError, RuntimeError) as e:
+                        if f is not None:
+                            f.close()
+                        self.set_status(500)
+                        self.write(f"Error reading file: {e}")
+                        return
                     self.set_header('Content-Type', 'text/plain; charset=utf-8')
                     self.write(f"Streaming file: {filename}\n\n")
                     await self.flush()
-                    
-                    with open(abspath, 'r', encoding='utf-8', errors='replace') as f:
-                        while True:
-                            chunk = f.read(CHUNK_SIZE)
-                            if not chunk:
-                                break
+
+                    with f:
+                        while chunk:
                             self.write(chunk)
                             await self.flush()
                             await asyncio.sleep(0.1)
+                            try:
+                                chunk = await loop.run_in_executor(None, f.read, CHUNK_SIZE)
+                            except (OSError, EOFError) as e:
+                                self.write(f"\n[... error reading file: {e} ...]\n")
+                                break
                     return
                 
                 # Handle filtering
                 filter_substring = self.get_argument('filter', None)
-                file_content = ""
-                if filter_substring:
-                    with open(abspath, 'r', encoding='utf-8', errors='replace') as f:
-                        file_content = ''.join([line for line in f if filter_substring in line])
-                else:
-                    with open(abspath, 'r', encoding='utf-8', errors='replace') as f:
-                        file_content = f.read()
+                try:
+                    # Filtering or decompressing a large log takes a while, keep it off the IOLoop
+                    file_content = await loop.run_in_executor(None, read_file_text, abspath, filter_substring)
+                except (OSError, EOFError, RuntimeError) as e:
+                    self.set_status(500)
+                    self.write(f"Error reading file: {e}")
+                    return
                 
                 # Add filter form HTML
                 filter_html = f'''
@@ -263,13 +1260,250 @@ class MainHandler(BaseHandler):
             self.set_status(404)
             self.write("File not found")
 
-class FileStreamHandler(tornado.websocket.WebSocketHandler):
+    async def serve_archive(self, path, archive, member):
+        try:
+            index = await ARCHIVE_INDEX.get(archive)
+        except (zipfile.BadZipFile, tarfile.TarError, OSError, EOFError) as e:
+            self.set_status(400)
+            self.write(f"Cannot read archive: {e}")
+            return
+        try:
+            await self._serve_archive_member(path, index, member)
+        finally:
+            ARCHIVE_INDEX.release(index)
+
+    async def _serve_archive_member(self, path, index, member):
+        entry = index["members"].get(member)
+        if not member or (entry and entry["is_dir"]):
+            path = path.rstrip('/')
+            self.render(
+                "browse.html",
+                current_path=path,
+                parent_path=os.path.dirname(path),
+                files=list_archive_directory(index, member),
+                join_path=join_path,
+                get_file_icon=get_file_icon,
+                # Archive contents are read-only
+                features=dict(FEATURE_FLAGS, file_upload=False, file_delete=False, file_rename=False, file_edit=False),
+            )
+            return
+        if entry is None:
+            self.set_status(404)
+            self.write("File not found in archive")
+            return
+
+        filename = os.path.basename(member)
+        download = self.get_argument('download', None)
+        if download and not FEATURE_FLAGS["file_download"]:
+            self.set_status(403)
+            self.write("File download is disabled.")
+            return
+        # Decompressing up to (and through) a member can take long, so every
+        # read from the archive happens in the executor
+        loop = tornado.ioloop.IOLoop.current()
+        try:
+            reader = await loop.run_in_executor(None, open_archive_member, index, member)
+        except (RuntimeError, NotImplementedError, zipfile.BadZipFile, tarfile.TarError) as e:
+            # e.g. encrypted zip members or unsupported compression methods
+            self.set_status(400)
+            self.write(f"Cannot read archive member: {e}")
+            return
+
+        if download:
+            AUDIT_LOG.record(self, "download", path)
+            self.set_header('Content-Type', 'application/octet-stream')
+            self.set_header('Content-Disposition', f'attachment; filename="{filename}"')
+            self.set_header('Content-Length', str(entry["size"]))
+            with reader as f:
+                while True:
+                    chunk = await loop.run_in_executor(None, f.read, CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.write(chunk)
+                    await self.flush()
+            return
+
+        filter_substring = self.get_argument('filter', None)
+        file_content = await loop.run_in_executor(None, read_archive_text, reader, filter_substring)
+        filter_html = f'''
+        <form method="get" style="margin-bottom:10px;">
+            <input type="text" name="filter" placeholder="Filter lines..." value="{filter_substring or ''}" style="width:200px;">
+            <button type="submit">Apply Filter</button>
+        </form>
+        '''
+        self.render("file.html", filename=filename, path=path, file_content=file_content, filter_html=filter_html, features=FEATURE_FLAGS)
+
+    async def send_file(self, abspath, filename, etag=None):
+        """Send a file as an attachment, honouring single and multiple byte ranges."""
+        size = os.path.getsize(abspath)
+        self.set_header('Accept-Ranges', 'bytes')
+        self.set_header('Content-Disposition', f'attachment; filename="{filename}"')
+        ranges = parse_byte_ranges(self.request.headers.get('Range'), size)
+        if_range = self.request.headers.get('If-Range')
+        if ranges is not None and if_range and if_range != etag:
+            ranges = None
+        if ranges == []:
+            self.set_status(416)
+            self.set_header('Content-Range', f'bytes */{size}')
+            return
+        if ranges is not None and len(ranges) > MAX_RANGES:
+            self.set_status(400)
+            self.write(f"Too many ranges (at most {MAX_RANGES}).")
+            return
+
+        with open(abspath, 'rb') as f:
+            if ranges is None:
+                self.set_header('Content-Type', 'application/octet-stream')
+                await self._send_bytes(f, 0, size - 1)
+            elif len(ranges) == 1:
+                start, end = ranges[0]
+                self.set_status(206)
+                self.set_header('Content-Type', 'application/octet-stream')
+                self.set_header('Content-Range', f'bytes {start}-{end}/{size}')
+                await self._send_bytes(f, start, end)
+            else:
+                boundary = secrets.token_hex(16)
+                self.set_status(206)
+                self.set_header('Content-Type', f'multipart/byteranges; boundary={boundary}')
+                for start, end in ranges:
+                    self.write(
+                        f"\r\n--{boundary}\r\n"
+                        f"Content-Type: application/octet-stream\r\n"
+                        f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                    )
+                    await self._send_bytes(f, start, end)
+                self.write(f"\r\n--{boundary}--\r\n")
+
+    async def _send_bytes(self, f, start, end):
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            self.write(chunk)
+            await self.flush()  # Ensure the chunk is sent
+
+class FileTail:
+    """Reads the complete lines appended to a file, like `tail -F`.
+
+    The file is reopened when its inode changes (logrotate rename) and read from
+    the start again when it shrinks (copytruncate). With follow=False a rotated
+    file is only read to its end and self.rotated is set, leaving it to the
+    caller to decide what to follow next. Reading starts at offset if given,
+    else at the start or the end of the file.
+    """
+
+    def __init__(self, path, from_start=False, offset=None, follow=True):
+        self.path = path
+        self.follow = follow
+        self.file = None
+        self.more = False
+        self.rotated = False
+        self._reopen()
+        if offset is not None:
+            self.file.seek(offset)
+        elif not from_start:
+            self.file.seek(0, os.SEEK_END)
+
+    def _reopen(self):
+        # Open the new file first so a failure leaves the old handle usable
+        new = open(self.path, 'rb')
+        if self.file is not None:
+            self.file.close()
+        self.file = new
+        st = os.fstat(new.fileno())
+        self.identity = (st.st_dev, st.st_ino)
+        self.partial = b""
+
+    def _read_available(self):
+        """Read up to TAIL_READ_LIMIT bytes; self.more tells if the limit was hit."""
+        data = self.file.read(TAIL_READ_LIMIT)
+        self.more = len(data) == TAIL_READ_LIMIT
+        return data
+
+    def read_lines(self):
+        """Return the newly completed lines as bytes, each ending in a newline.
+
+        At most TAIL_READ_LIMIT bytes are read per call; while self.more is set
+        there is more to read right away.
+        """
+        text = self._split_lines(self._read_available())
+        if self.more:
+            # Rotation and truncation are checked once the backlog is read
+            return text
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            # Rotated away and not recreated yet: keep reading the old handle
+            st = None
+        if st is not None and (st.st_dev, st.st_ino) != self.identity:
+            # Finish what was written to the old file, then follow the new one
+            text += self._split_lines(self._read_available())
+            if self.more:
+                return text
+            if self.partial:
+                text += self.partial + b"\n"
+                self.partial = b""
+            if not self.follow:
+                self.rotated = True
+                return text
+            try:
+                self._reopen()
+            except OSError:
+                # Replaced again or not readable yet: retry on the next read
+                return text
+            text += self._split_lines(self._read_available())
+        elif st is not None and st.st_size < self.file.tell():
+            self.file.seek(0)
+            self.partial = b""
+            text += self._split_lines(self._read_available())
+        return text
+
+    def _split_lines(self, data):
+        """Return the complete lines in partial+data, keeping the trailing fragment."""
+        data = self.partial + data
+        cut = data.rfind(b"\n") + 1
+        if len(data) - cut >= TAIL_READ_LIMIT:
+            # An overlong line is passed on in pieces rather than held back forever
+            self.partial = b""
+            return data + b"\n"
+        self.partial = data[cut:]
+        return data[:cut]
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+class StreamSocketHandler(AdmissionMixin, tornado.websocket.WebSocketHandler):
+    """Base for websockets that hold a "stream" admission slot while open."""
     def get_current_user(self) -> str | None:
         return self.get_secure_cookie("user")
 
     def check_origin(self, origin):
         return True
 
+    async def get(self, *args, **kwargs):
+        if self.current_user and not await self.acquire_slot("stream"):
+            return
+        await super().get(*args, **kwargs)
+        if self.ws_connection is None:
+            # Handshake failed, so on_close will never run
+            self.release_slots()
+
+    def on_finish(self):
+        # finish() runs as soon as the handshake completes; the slot is held until on_close
+        pass
+
+    def on_close(self):
+        self.release_slots()
+
+class FileStreamHandler(StreamSocketHandler):
+    """Follows one file through FileTail. Compressed files are static, so only
+    their last lines are sent."""
+
     async def open(self, path):
         if not self.current_user:
             self.close()
@@ -278,22 +1512,26 @@ class FileStreamHandler(tornado.websocket.WebSocketHandler):
         path = path.lstrip('/')
         self.file_path = os.path.abspath(os.path.join(ROOT_DIR, path))
         self.running = True
-        if not os.path.isfile(self.file_path):
+        if not self.file_path.startswith(ROOT_DIR) or not os.path.isfile(self.file_path):
             await self.write_message(f"File not found: {self.file_path}")
             self.close()
             return
 
         try:
-            with open(self.file_path, 'r', encoding='utf-8', errors='replace') as f:
-                last_100_lines = deque(f, 100)
+            # Decompressing a whole .gz/.zst file takes a while, keep it off the IOLoop
+            last_100_lines = await tornado.ioloop.IOLoop.current().run_in_executor(
+                None, read_last_lines, self.file_path, 100
+            )
             if last_100_lines:
-                await self.write_message("".join(last_100_lines))
+                await self.write_message("\n".join(last_100_lines))
         except Exception as e:
             await self.write_message(f"Error reading file history: {e}")
 
+        if is_compressed(self.file_path):
+            return
+
         try:
-            self.file = open(self.file_path, 'r', encoding='utf-8', errors='replace')
-            self.file.seek(0, os.SEEK_END)
+            self.tail = FileTail(self.file_path)
         except Exception as e:
             await self.write_message(f"Error opening file for streaming: {e}")
             self.close()
@@ -303,24 +1541,576 @@ class FileStreamHandler(tornado.websocket.WebSocketHandler):
         self.periodic.start()
 
     async def send_new_lines(self):
-        if not self.running:
-            return
-        where = self.file.tell()
-        line = self.file.readline()
-        while line:
-            await self.write_message(line)
-            where = self.file.tell()
-            line = self.file.readline()
-        self.file.seek(where)
+        # A large backlog goes out as several messages of at most TAIL_READ_LIMIT
+        while self.running:
+            text = self.tail.read_lines()
+            if text:
+                await self.write_message(text.decode('utf-8', errors='replace').rstrip("\n"))
+            if not self.tail.more:
+                break
 
     def on_close(self):
         self.running = False
+        super().on_close()
         if hasattr(self, 'periodic'):
             self.periodic.stop()
-        if hasattr(self, 'file'):
-            self.file.close()
+        if hasattr(self, 'tail'):
+            self.tail.close()
+
+class Inotify:
+    """Minimal ctypes binding to Linux inotify; `available` is False elsewhere."""
+    IN_MODIFY = 0x00000002
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_CREATE = 0x00000100
+    IN_DELETE = 0x00000200
+    IN_DELETE_SELF = 0x00000400
+    IN_MOVE_SELF = 0x00000800
+    IN_Q_OVERFLOW = 0x00004000
+    IN_IGNORED = 0x00008000
+    DIR_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+                | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF)
+    EVENT_HEADER = struct.Struct("iIII")
+
+    def __init__(self):
+        self.fd = -1
+        try:
+            self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+            self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except (OSError, AttributeError):
+            self._libc = None
+
+    @property
+    def available(self):
+        return self.fd >= 0
+
+    def add_watch(self, path, mask=DIR_MASK):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), path)
+        return wd
+
+    def rm_watch(self, wd):
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read_events(self):
+        """Yield (wd, mask, name) for every queued event."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b"\0")
+            offset += length
+            yield wd, mask, os.fsdecode(name)
+
+class DirectoryWatcher:
+    """Reports add/remove/modify deltas of watched directories to subscribers.
+
+    Uses one inotify descriptor on the IOLoop (or periodic scans where inotify is
+    unavailable). Events are coalesced per entry name and flushed after
+    WATCH_DEBOUNCE; each flushed name is stat'ed once and reported as an upsert
+    or a removal, so create+write+delete bursts collapse into one change.
+    Subscribers implement on_directory_change(abspath, delta) and
+    on_directory_removed(abspath). When the kernel event queue overflows they
+    get {"type": "resync"} instead of a delta, since changes may have been lost.
+    """
+
+    def __init__(self):
+        self.inotify = None
+        self.watches = {}   # abspath -> state dict
+        # inotify watch descriptor -> abspaths; paths reaching the same directory
+        # through a symlink share one descriptor
+        self.by_wd = {}
+
+    def _start(self):
+        if self.inotify is None:
+            self.inotify = Inotify()
+            if self.inotify.available:
+                tornado.ioloop.IOLoop.current().add_handler(
+                    self.inotify.fd, self._on_inotify, tornado.ioloop.IOLoop.READ
+                )
+
+    def subscribe(self, abspath, handler):
+        self._start()
+        watch = self.watches.get(abspath)
+        if watch is None:
+            watch = {"subscribers": set(), "pending": set(), "timer": None, "wd": None, "poller": None}
+            if self.inotify.available:
+                watch["wd"] = self.inotify.add_watch(abspath)
+                self.by_wd.setdefault(watch["wd"], set()).add(abspath)
+            else:
+                watch["snapshot"] = self._snapshot(abspath)
+                watch["poller"] = tornado.ioloop.PeriodicCallback(
+                    lambda: self._poll(abspath), WATCH_POLL_INTERVAL * 1000
+                )
+                watch["poller"].start()
+            self.watches[abspath] = watch
+        watch["subscribers"].add(handler)
+
+    def unsubscribe(self, abspath, handler):
+        watch = self.watches.get(abspath)
+        if watch is None:
+            return
+        watch["subscribers"].discard(handler)
+        if not watch["subscribers"]:
+            self._drop(abspath)
 
+    def _drop(self, abspath):
+        watch = self.watches.pop(abspath, None)
+        if watch is None:
+            return
+        if watch["timer"] is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(watch["timer"])
+        if watch["poller"] is not None:
+            watch["poller"].stop()
+        if watch["wd"] is not None:
+            paths = self.by_wd.get(watch["wd"], set())
+            paths.discard(abspath)
+            if not paths:
+                # Only remove the kernel watch once no other path uses it
+                self.by_wd.pop(watch["wd"], None)
+                self.inotify.rm_watch(watch["wd"])
+
+    def _on_inotify(self, fd, events):
+        for wd, mask, name in self.inotify.read_events():
+            if mask & Inotify.IN_Q_OVERFLOW:
+                for abspath in list(self.watches):
+                    self._resync(abspath)
+                continue
+            for abspath in list(self.by_wd.get(wd, ())):
+                if mask & (Inotify.IN_DELETE_SELF | Inotify.IN_MOVE_SELF | Inotify.IN_IGNORED):
+                    self._close_subscribers(abspath)
+                elif name:
+                    self._queue(abspath, name)
+
+    @staticmethod
+    def _snapshot(abspath):
+        snapshot = {}
+        try:
+            for entry in os.scandir(abspath):
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                snapshot[entry.name] = (st.st_mtime_ns, st.st_size, st.st_mode)
+        except OSError:
+            pass
+        return snapshot
+
+    def _poll(self, abspath):
+        watch = self.watches.get(abspath)
+        if watch is None:
+            return
+        if not os.path.isdir(abspath):
+            self._close_subscribers(abspath)
+            return
+        old, new = watch["snapshot"], self._snapshot(abspath)
+        watch["snapshot"] = new
+        for name in old.keys() | new.keys():
+            if old.get(name) != new.get(name):
+                self._queue(abspath, name)
+
+    def _queue(self, abspath, name):
+        watch = self.watches[abspath]
+        watch["pending"].add(name)
+        if watch["timer"] is None:
+            watch["timer"] = tornado.ioloop.IOLoop.current().call_later(
+                WATCH_DEBOUNCE, self._flush, abspath
+            )
+
+    def _flush(self, abspath):
+        watch = self.watches.get(abspath)
+        if watch is None:
+            return
+        names, watch["pending"], watch["timer"] = watch["pending"], set(), None
+        upserts, removes = [], []
+        for name in sorted(names):
+            try:
+                info = get_file_info(name, os.stat(os.path.join(abspath, name)))
+            except OSError:
+                removes.append(name)
+                continue
+            info["icon"] = "📁" if info["is_dir"] else get_file_icon(name)
+            upserts.append(info)
+        self._notify(abspath, {"type": "delta", "upserts": upserts, "removes": removes})
+
+    def _resync(self, abspath):
+        """Tell subscribers that events were lost and they must re-read the directory."""
+        watch = self.watches.get(abspath)
+        if watch is None:
+            return
+        if watch["timer"] is not None:
+            tornado.ioloop.IOLoop.current().remove_timeout(watch["timer"])
+        watch["pending"], watch["timer"] = set(), None
+        self._notify(abspath, {"type": "resync"})
+
+    def _notify(self, abspath, delta):
+        watch = self.watches[abspath]
+        for handler in list(watch["subscribers"]):
+            try:
+                handler.on_directory_change(abspath, delta)
+            except tornado.websocket.WebSocketClosedError:
+                watch["subscribers"].discard(handler)
+            except Exception:
+                # One failing subscriber must not stop deltas for the others
+                logging.exception("Directory change handler failed for %s", abspath)
+
+    def _close_subscribers(self, abspath):
+        watch = self.watches.get(abspath)
+        if watch is None:
+            return
+        subscribers = list(watch["subscribers"])
+        self._drop(abspath)
+        for handler in subscribers:
+            handler.on_directory_removed(abspath)
+
+DIRECTORY_WATCHER = DirectoryWatcher()
+
+class DirectoryWatchSocketHandler(tornado.websocket.WebSocketHandler):
+    """Streams change deltas for one directory to an open browse page."""
+    def get_current_user(self) -> str | None:
+        return self.get_secure_cookie("user")
+
+    def check_origin(self, origin):
+        return True
+
+    def open(self, path):
+        self.watched = None
+        if not self.current_user:
+            self.close()
+            return
+        abspath = os.path.abspath(os.path.join(ROOT_DIR, path.strip('/')))
+        if not abspath.startswith(ROOT_DIR) or not os.path.isdir(abspath):
+            self.close(reason="Directory not found")
+            return
+        try:
+            DIRECTORY_WATCHER.subscribe(abspath, self)
+        except OSError as e:
+            self.close(reason=f"Cannot watch directory: {e.strerror}")
+            return
+        self.watched = abspath
+
+    def on_directory_change(self, abspath, delta):
+        self.write_message(json.dumps(delta))
+
+    def on_directory_removed(self, abspath):
+        self.watched = None
+        self.close(reason="Directory was removed")
+
+    def on_close(self):
+        if getattr(self, 'watched', None):
+            DIRECTORY_WATCHER.unsubscribe(self.watched, self)
+
+def parse_line_timestamp(line):
+    """Return the epoch time of a `YYYY-MM-DD HH:MM:SS[.ffffff]` stamp near the
+    start of a log line (as local time), or None."""
+    match = LOG_TIMESTAMP.search(line, 0, 64)
+    if not match:
+        return None
+    try:
+        ts = datetime.fromisoformat(f"{match.group(1)}T{match.group(2)}").timestamp()
+    except ValueError:
+        return None
+    if match.group(3):
+        ts += int(match.group(3).ljust(6, "0")) / 1e6
+    return ts
+
+class MergedTailSocketHandler(StreamSocketHandler):
+    """Tails every file matching `?glob=` patterns and/or `?path=` arguments and
+    sends their lines as one stream, ordered by log timestamp.
+
+    Each file has one FileTail, read when the DirectoryWatcher reports a change
+    in its directory; new files matching a glob are picked up the same way.
+    For `**` globs every directory under the glob's base is watched as well
+    (up to MULTI_TAIL_MAX_WATCHES), so files in new subdirectories are found.
+    When a file is rotated its tail stops at the old file's end, and the file's
+    new name (if it still matches) continues from that offset, so no line is
+    sent twice.
+    Lines wait up to MULTI_TAIL_REORDER_WINDOW in a heap so that lines from
+    different files arriving slightly out of order still come out sorted. Lines
+    without a timestamp inherit the previous one of their file.
+    """
+
+    async def open(self):
+        self.tails = {}
+        self.watched = set()
+        if not self.current_user:
+            self.close()
+            return
+        self.patterns = self._resolve(self.get_arguments("glob"))
+        self.paths = self._resolve(self.get_arguments("path"))
+        if not self.patterns and not self.paths:
+            self.close(reason="A glob or path argument is required")
+            return
+        self.known_inodes = set()
+        self.handoff = {}   # (dev, inode) of a rotated file -> offset read up to
+        self.discover_pending = False
+        self.discover_lock = tornado.locks.Lock()
+        self.last_ts = {}
+        self.buffer = []
+        self.seq = itertools.count()
+        self.recursive_bases = []
+
+        for pattern in self.patterns:
+            base = pattern
+            while glob.has_magic(base):
+                base = os.path.dirname(base)
+            self._watch(base)
+            if "**" in pattern:
+                self.recursive_bases.append(base)
+        for path in self.paths:
+            self._watch(os.path.dirname(path))
+        self.flusher = tornado.ioloop.PeriodicCallback(self._flush, 250)
+        self.flusher.start()
+        await self._discover(initial=True)
+
+    @staticmethod
+    def _resolve(paths):
+        resolved = []
+        for path in paths:
+            abspath = os.path.abspath(os.path.join(ROOT_DIR, path.lstrip('/')))
+            if abspath.startswith(ROOT_DIR):
+                resolved.append(abspath)
+        return resolved
+
+    def _watch(self, directory):
+        if directory in self.watched or not os.path.isdir(directory):
+            return
+        try:
+            DIRECTORY_WATCHER.subscribe(directory, self)
+        except OSError as e:
+            logging.warning("Cannot watch %s: %s", directory, e)
+            return
+        self.watched.add(directory)
+
+    def _recursive_directories(self):
+        directories = []
+        for base in self.recursive_bases:
+            for dirpath, dirnames, _filenames in os.walk(base):
+                # glob's ** skips hidden directories too
+                dirnames[:] = sorted(name for name in dirnames if not name.startswith('.'))
+                directories.append(dirpath)
+                if len(directories) >= MULTI_TAIL_MAX_WATCHES:
+                    return directories
+        return directories
+
+    def _matching_files(self):
+        found = set()
+        for pattern in self.patterns:
+            for match in glob.glob(pattern, recursive=True):
+                found.add(os.path.abspath(match))
+        found.update(self.paths)
+        # Compressed (rotated) logs never grow, so there is nothing to follow
+        return sorted(path for path in found
+                      if path.startswith(ROOT_DIR) and os.path.isfile(path) and not is_compressed(path))
+
+    def _may_match(self, path):
+        """Cheap check whether a changed path could be a new file to follow."""
+        if is_compressed(path):
+            return False
+        return path in self.paths or any(fnmatch.fnmatch(path, pattern) for pattern in self.patterns)
+
+    def _schedule_discover(self):
+        if not self.discover_pending:
+            self.discover_pending = True
+            tornado.ioloop.IOLoop.current().spawn_callback(self._discover)
+
+    @staticmethod
+    def _read_histories(ends):
+        """Last MULTI_TAIL_HISTORY lines of each file up to where its tail starts."""
+        histories = {}
+        for path, end in ends.items():
+            try:
+                histories[path] = read_last_lines(path, MULTI_TAIL_HISTORY, end)
+            except OSError as e:
+                logging.warning("Cannot read history of %s: %s", path, e)
+        return histories
+
+    async def _discover(self, initial=False):
+        # Globbing a large tree and reading history block, so both run in the executor
+        async with self.discover_lock:
+            self.discover_pending = False
+            loop = tornado.ioloop.IOLoop.current()
+            matches = await loop.run_in_executor(None, self._matching_files)
+            directories = []
+            if self.recursive_bases:
+                directories = await loop.run_in_executor(None, self._recursive_directories)
+            if self.ws_connection is None:
+                return
+            for directory in directories:
+                self._watch(directory)
+            history_ends = self._start_tails(matches, initial)
+            if history_ends:
+                histories = await loop.run_in_executor(None, self._read_histories, history_ends)
+                for path, lines in histories.items():
+                    for line in lines:
+                        self._buffer_line(path, line, arrival=0)
+
+    def _start_tails(self, matches, initial):
+        """Open tails for newly matched files; returns {path: offset} of those
+        whose history is to be sent."""
+        history_ends = {}
+        following = {tail.identity for tail in self.tails.values()}
+        added = False
+        for path in matches:
+            if path in self.tails:
+                continue
+            if len(self.tails) >= MULTI_TAIL_MAX_FILES:
+                break
+            try:
+                st = os.stat(path)
+                identity = (st.st_dev, st.st_ino)
+                if identity in following:
+                    # Renamed but not rotated yet: still read under its old name
+                    continue
+                offset = self.handoff.pop(identity, None)
+                # Files created after we started are read from the beginning,
+                # except a rotated file we were already following under another name
+                from_start = not initial and identity not in self.known_inodes
+                self.tails[path] = FileTail(path, from_start=from_start, offset=offset, follow=False)
+                if initial:
+                    # History ends exactly where the tail starts reading
+                    history_ends[path] = self.tails[path].file.tell()
+            except OSError as e:
+                logging.warning("Cannot tail %s: %s", path, e)
+                continue
+            self.known_inodes.add(identity)
+            following.add(identity)
+            self._watch(os.path.dirname(path))
+            added = True
+            if from_start or offset is not None:
+                self._read(path)
+        # Rotated files whose new name is never matched would stay here forever
+        while len(self.handoff) > MULTI_TAIL_MAX_FILES:
+            del self.handoff[next(iter(self.handoff))]
+        if added:
+            self.write_message(json.dumps({
+                "type": "files",
+                "files": sorted(os.path.relpath(path, ROOT_DIR) for path in self.tails),
+            }))
+        return history_ends
+
+    def on_directory_change(self, abspath, delta):
+        if delta["type"] == "resync":
+            # Events were lost: check every file and look for new ones
+            for path in list(self.tails):
+                self._read(path)
+            self._schedule_discover()
+            return
+        changed = {os.path.join(abspath, entry["name"]) for entry in delta["upserts"]}
+        changed.update(os.path.join(abspath, name) for name in delta["removes"])
+        for path in changed:
+            if path in self.tails:
+                self._read(path)
+        if any(path not in self.tails and self._may_match(path) for path in changed):
+            self._schedule_discover()
+        elif self.recursive_bases and any(entry["is_dir"] for entry in delta["upserts"]):
+            # A new subdirectory may hold matching files and must be watched itself
+            self._schedule_discover()
+
+    def on_directory_removed(self, abspath):
+        # Tails of files that were in it end on their own; the stream goes on
+        self.watched.discard(abspath)
+        if not self.watched:
+            self.close(reason="Directory was removed")
+
+    def _read(self, path):
+        tail = self.tails.get(path)
+        if tail is None:
+            return
+        try:
+            data = tail.read_lines()
+        except (OSError, ValueError) as e:
+            # Drop the tail; _discover picks the file up again if it comes back
+            logging.warning("Stopped tailing %s: %s", path, e)
+            tail.close()
+            del self.tails[path]
+            return
+        if tail.rotated:
+            # The old file is read to its end; whoever has its inode now takes over
+            self.handoff[tail.identity] = tail.file.tell()
+            tail.close()
+            del self.tails[path]
+            self._schedule_discover()
+        elif tail.more:
+            # Read the rest of a large backlog without holding the IOLoop
+            tornado.ioloop.IOLoop.current().add_callback(self._read, path)
+        if not data:
+            return
+        arrival = time.monotonic()
+        for line in data.decode('utf-8', errors='replace').splitlines():
+            self._buffer_line(path, line, arrival)
+        if len(self.buffer) > MULTI_TAIL_MAX_BUFFER:
+            self._flush(force=True)
+
+    def _buffer_line(self, path, line, arrival):
+        ts = parse_line_timestamp(line) or self.last_ts.get(path) or time.time()
+        self.last_ts[path] = ts
+        heapq.heappush(self.buffer, (ts, next(self.seq), arrival, os.path.relpath(path, ROOT_DIR), line))
+
+    def _flush(self, force=False):
+        if self.ws_connection is None:
+            return
+        cutoff = time.monotonic() - MULTI_TAIL_REORDER_WINDOW
+        lines = []
+        while self.buffer and (force or self.buffer[0][2] <= cutoff):
+            ts, _seq, _arrival, source, line = heapq.heappop(self.buffer)
+            lines.append({"source": source, "time": ts, "line": line})
+        if lines:
+            self.write_message(json.dumps({"type": "lines", "lines": lines}))
+
+    def on_close(self):
+        super().on_close()
+        if hasattr(self, 'flusher'):
+            self.flusher.stop()
+        for directory in self.watched:
+            DIRECTORY_WATCHER.unsubscribe(directory, self)
+        self.watched = set()
+        for tail in self.tails.values():
+            tail.close()
+        self.tails = {}
+
+class MergedTailHandler(BaseHandler):
+    @tornado.web.authenticated
+    def get(self):
+        self.render("tail.html", patterns=self.get_arguments("glob"), paths=self.get_arguments("path"))
+
+@tornado.web.stream_request_body
 class UploadHandler(BaseHandler):
+    """The body is streamed, so prepare() runs before any of it is read: an upload
+    only buffers its body once it holds an admission slot, and queued or
+    rejected uploads cost no memory."""
+
+    async def prepare(self):
+        self._chunks = []
+        if not self.current_user:
+            # What @authenticated does for POST, but before the body is read
+            raise tornado.web.HTTPError(403)
+        await self.acquire_slot("upload")
+
+    def data_received(self, chunk):
+        self._chunks.append(chunk)
+
+    def _parse_body(self):
+        self.request.body = b"".join(self._chunks)
+        self._chunks = []
+        tornado.httputil.parse_body_arguments(
+            self.request.headers.get("Content-Type", ""),
+            self.request.body,
+            self.request.body_arguments,
+            self.request.files,
+            self.request.headers,
+        )
+        for name, values in self.request.body_arguments.items():
+            self.request.arguments.setdefault(name, []).extend(values)
+
     @tornado.web.authenticated
     def post(self):
         if not FEATURE_FLAGS["file_upload"]:
@@ -328,6 +2118,8 @@ class UploadHandler(BaseHandler):
             self.write("File upload is disabled.")
             return
 
+        self._parse_body()
+
         directory = self.get_argument("directory", "")
         file_infos = self.request.files.get('files', [])
         
@@ -340,14 +2132,15 @@ class UploadHandler(BaseHandler):
                 self.write("Forbidden")
                 return
             os.makedirs(upload_path, exist_ok=True)
-            with open(os.path.join(upload_path, filename), 'wb') as f:
-                f.write(file_info['body'])
+            replace_file(os.path.join(upload_path, filename), file_info['body'])
+            HASH_CACHE.record_write(os.path.join(upload_path, filename))
+            AUDIT_LOG.record(self, "upload", join_path(directory, filename), size=len(file_info['body']))
+            HASH_CACHE.schedule(os.path.abspath(os.path.join(upload_path, filename)))
             self.redirect("/files/" + directory)
             return
 
         for file_info in file_infos:
             if len(file_info['body']) > MAX_FILE_SIZE:
-                print("MAXXX")
                 self.set_status(413)
                 self.write(f"File {file_info['filename']} is too large.")
                 return
@@ -364,12 +2157,154 @@ class UploadHandler(BaseHandler):
 
             os.makedirs(os.path.dirname(final_path_abs), exist_ok=True)
             
-            with open(final_path_abs, 'wb') as f:
-                f.write(file_body)
+            replace_file(final_path_abs, file_body)
+            HASH_CACHE.record_write(final_path_abs)
+            AUDIT_LOG.record(self, "upload", join_path(directory, relative_path), size=len(file_body))
+            HASH_CACHE.schedule(final_path_abs)
         
         self.set_status(200)
         self.write("Upload successful")
 
+class UploadDedupHandler(BaseHandler):
+    """Lets a client offer a content hash before uploading.
+
+    If content with that hash already exists under ROOT_DIR it is put into place
+    and the client can skip the transfer: hardlinked when the source is a file
+    aird wrote itself and is unchanged since, copied otherwise (or across devices).
+    """
+    @tornado.web.authenticated
+    async def post(self):
+        if not FEATURE_FLAGS["file_upload"]:
+            self.set_status(403)
+            self.write({"error": "File upload is disabled."})
+            return
+
+        try:
+            data = json.loads(self.request.body or b'{}')
+        except ValueError:
+            self.set_status(400)
+            self.write({"error": "Invalid JSON"})
+            return
+
+        directory = data.get("directory", "")
+        filename = data.get("filename", "")
+        digest = str(data.get("hash", "")).lower()
+        algorithm = data.get("algorithm", DEFAULT_HASH_ALGORITHM)
+        size = data.get("size")
+        if not filename or not is_valid_digest(digest, algorithm):
+            self.set_status(400)
+            self.write({"error": "filename and a valid hash are required"})
+            return
+
+        target_dir = os.path.abspath(os.path.join(ROOT_DIR, directory))
+        target = os.path.abspath(os.path.join(target_dir, filename))
+        if not (target_dir.startswith(ROOT_DIR) and target.startswith(target_dir)):
+            self.set_status(403)
+            self.write({"error": "Forbidden"})
+            return
+
+        source = HASH_CACHE.find(digest, algorithm, size)
+        if source is None:
+            self.set_status(404)
+            self.write({"deduplicated": False})
+            return
+
+        if os.path.isdir(target):
+            self.set_status(409)
+            self.write({"error": "A directory with that name already exists"})
+            return
+
+        if os.path.abspath(source) != target:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # A cross-device copy can take a while, keep it off the IOLoop
+            # Only files aird wrote itself are hardlinked: anything else may be
+            # changed in place by another process, and the upload with it
+            allow_link = HASH_CACHE.is_own_write(source)
+            method = await tornado.ioloop.IOLoop.current().run_in_executor(
+                None, link_or_copy, source, target, allow_link
+            )
+            if method == "copy":
+                HASH_CACHE.record_write(target)
+                HASH_CACHE.schedule(target, algorithm)
+        else:
+            method = "existing"
+        AUDIT_LOG.record(self, "upload", join_path(directory, filename), deduplicated=method, hash=digest)
+        self.write({"deduplicated": True, "method": method})
+
+class HashAPIHandler(BaseHandler):
+    @tornado.web.authenticated
+    async def get(self, path):
+        path = path.strip('/')
+        abspath = os.path.abspath(os.path.join(ROOT_DIR, path))
+        if not abspath.startswith(ROOT_DIR):
+            self.set_status(403)
+            self.write({"error": "Forbidden"})
+            return
+        if not os.path.isfile(abspath):
+            self.set_status(404)
+            self.write({"error": "File not found"})
+            return
+
+        algorithm = self.get_argument("algorithm", DEFAULT_HASH_ALGORITHM)
+        if algorithm not in HASH_ALGORITHMS:
+            self.set_status(400)
+            self.write({"error": f"Unsupported algorithm: {algorithm}"})
+            return
+
+        try:
+            digest = await HASH_CACHE.get(abspath, algorithm)
+        except Exception as e:
+            self.set_status(500)
+            self.write({"error": str(e)})
+            return
+        self.write({
+            "path": path,
+            "algorithm": algorithm,
+            "hash": digest,
+            "size": os.path.getsize(abspath),
+            "etag": strong_etag(digest, algorithm),
+        })
+
+class BlockChecksumAPIHandler(BaseHandler):
+    """Per-block checksums of a file, for clients mirroring it with delta transfers."""
+    @tornado.web.authenticated
+    async def get(self, path):
+        if not FEATURE_FLAGS["file_download"]:
+            self.set_status(403)
+            self.write({"error": "File download is disabled."})
+            return
+        path = path.strip('/')
+        abspath = os.path.abspath(os.path.join(ROOT_DIR, path))
+        if not abspath.startswith(ROOT_DIR):
+            self.set_status(403)
+            self.write({"error": "Forbidden"})
+            return
+        if not os.path.isfile(abspath):
+            self.set_status(404)
+            self.write({"error": "File not found"})
+            return
+
+        try:
+            block_size = int(self.get_argument("block_size", DEFAULT_BLOCK_SIZE))
+        except ValueError:
+            block_size = DEFAULT_BLOCK_SIZE
+        block_size = max(MIN_BLOCK_SIZE, min(block_size, MAX_BLOCK_SIZE))
+
+        try:
+            st = os.stat(abspath)
+            blocks = await HASH_CACHE.blocks(abspath, block_size)
+        except Exception as e:
+            self.set_status(500)
+            self.write({"error": str(e)})
+            return
+        self.write({
+            "path": path,
+            "size": st.st_size,
+            "mtime_ns": st.st_mtime_ns,
+            "block_size": block_size,
+            "blocks": blocks,
+        })
+
 class DeleteHandler(BaseHandler):
     @tornado.web.authenticated
     def post(self):
@@ -389,6 +2324,11 @@ class DeleteHandler(BaseHandler):
             shutil.rmtree(abspath)
         elif os.path.isfile(abspath):
             os.remove(abspath)
+        else:
+            self.set_status(404)
+            self.write("File not found")
+            return
+        AUDIT_LOG.record(self, "delete", path)
         parent = os.path.dirname(path)
         self.redirect("/files/" + parent if parent else "/files/")
 
@@ -410,6 +2350,7 @@ class RenameHandler(BaseHandler):
             self.write("Forbidden")
             return
         os.rename(abspath, new_abspath)
+        AUDIT_LOG.record(self, "rename", path, new_path=join_path(os.path.dirname(path), new_name))
         parent = os.path.dirname(path)
         self.redirect("/files/" + parent if parent else "/files/")
 
@@ -438,8 +2379,9 @@ class EditHandler(BaseHandler):
             return
 
         try:
-            with open(abspath, 'w', encoding='utf-8') as f:
-                f.write(content)
+            replace_file(abspath, content.encode('utf-8'))
+            HASH_CACHE.record_write(abspath)
+            AUDIT_LOG.record(self, "edit", path, size=len(content))
             self.set_status(200)
             self.write("File saved successfully.")
         except Exception as e:
@@ -448,30 +2390,29 @@ class EditHandler(BaseHandler):
 
 class FileListAPIHandler(BaseHandler):
     @tornado.web.authenticated
-    def get(self, path):
-        print(f"DEBUG: FileListAPIHandler called with path: '{path}'")
+    async def get(self, path):
+        if not await self.acquire_slot("listing"):
+            return
+        logging.debug("FileListAPIHandler called with path: '%s'", path)
         self.set_header("Content-Type", "application/json")
         
         # Normalize path
         path = path.strip('/')
         abspath = os.path.abspath(os.path.join(ROOT_DIR, path))
-        print(f"DEBUG: Normalized path: '{path}', abspath: '{abspath}'")
+        logging.debug("Normalized path: '%s', abspath: '%s'", path, abspath)
         
         if not abspath.startswith(ROOT_DIR):
-            print(f"DEBUG: Forbidden - abspath doesn't start with ROOT_DIR")
             self.set_status(403)
             self.write({"error": "Forbidden"})
             return
 
         if not os.path.isdir(abspath):
-            print(f"DEBUG: Directory not found: {abspath}")
             self.set_status(404)
             self.write({"error": "Directory not found"})
             return
 
         try:
             files = get_files_in_directory(abspath)
-            print(f"DEBUG: Found {len(files)} files")
             result = {
                 "path": path,
                 "files": [
@@ -479,14 +2420,16 @@ class FileListAPIHandler(BaseHandler):
                         "name": f["name"],
                         "is_dir": f["is_dir"],
                         "size_str": f.get("size_str", "-"),
-                        "modified": f.get("modified", "-")
+                        "size_bytes": f.get("size_bytes", 0),
+                        "modified": f.get("modified", "-"),
+                        "modified_timestamp": f.get("modified_timestamp", 0)
                     }
                     for f in files
                 ]
             }
             self.write(result)
         except Exception as e:
-            print(f"DEBUG: Exception: {e}")
+            logging.exception("Listing %s failed", abspath)
             self.set_status(500)
             self.write({"error": str(e)})
 
@@ -513,6 +2456,8 @@ class ShareCreateHandler(BaseHandler):
                 return
             sid = secrets.token_urlsafe(8)
             SHARES[sid] = {"paths": valid_paths, "created": datetime.utcnow().isoformat()}
+            for p in valid_paths:
+                AUDIT_LOG.record(self, "share", p, share_id=sid)
             self.write({"id": sid, "url": f"/shared/{sid}"})
         except Exception as e:
             self.set_status(500)
@@ -543,8 +2488,8 @@ class SharedListHandler(tornado.web.RequestHandler):
             return
         self.render("shared_list.html", share_id=sid, files=share['paths'])
 
-class SharedFileHandler(tornado.web.RequestHandler):
-    def get(self, sid, path):
+class SharedFileHandler(AdmissionMixin, tornado.web.RequestHandler):
+    async def get(self, sid, path):
         share = SHARES.get(sid)
         if not share:
             self.set_status(404)
@@ -554,11 +2499,14 @@ class SharedFileHandler(tornado.web.RequestHandler):
             self.set_status(403)
             self.write("File not in share")
             return
+        if not await self.acquire_slot("download"):
+            return
         abspath = os.path.abspath(os.path.join(ROOT_DIR, path))
         if not (abspath.startswith(ROOT_DIR) and os.path.isfile(abspath)):
             self.set_status(404)
             self.write("File not found")
             return
+        AUDIT_LOG.record(self, "download", path, share_id=sid)
         self.set_header('Content-Type', 'text/plain; charset=utf-8')
         with open(abspath, 'r', encoding='utf-8', errors='replace') as f:
             self.write(f.read())
@@ -579,13 +2527,21 @@ def make_app(settings, ldap_enabled=False, ldap_server=None, ldap_base_dn=None):
         (r"/login", login_handler),
         (r"/admin/login", AdminLoginHandler),
         (r"/admin", AdminHandler),
+        (r"/admin/metrics", AdminMetricsHandler),
+        (r"/admin/audit", AdminAuditHandler),
         (r"/stream/(.*)", FileStreamHandler),
+        (r"/watch/(.*)", DirectoryWatchSocketHandler),
+        (r"/tail", MergedTailHandler),
+        (r"/tail/ws", MergedTailSocketHandler),
         (r"/features", FeatureFlagSocketHandler),
         (r"/upload", UploadHandler),
+        (r"/upload/dedup", UploadDedupHandler),
         (r"/delete", DeleteHandler),
         (r"/rename", RenameHandler),
         (r"/edit", EditHandler),
         (r"/api/files/(.*)", FileListAPIHandler),
+        (r"/api/hash/(.*)", HashAPIHandler),
+        (r"/api/blocks/(.*)", BlockChecksumAPIHandler),
         (r"/share", ShareFilesHandler),
         (r"/share/create", ShareCreateHandler),
         (r"/share/revoke", ShareRevokeHandler),
@@ -606,6 +2562,9 @@ def main():
     parser.add_argument("--ldap", action="store_true", help="Enable LDAP authentication")
     parser.add_argument("--ldap-server", help="LDAP server address")
     parser.add_argument("--ldap-base-dn", help="LDAP base DN for user search")
+    parser.add_argument("--hash-cache", help="Path to the persistent content hash cache")
+    parser.add_argument("--audit-log-dir", help="Directory for the rotating JSON-lines audit log")
+    parser.add_argument("--audit-fsync", choices=["always", "interval", "never"], help="When to fsync the audit log")
     args = parser.parse_args()
 
     logging.basicConfig(level=logging.INFO, format='%(levelname)s:%(name)s:%(message)s')
@@ -620,6 +2579,10 @@ def main():
     token = args.token or config.get("token") or os.environ.get("AIRD_ACCESS_TOKEN") or secrets.token_urlsafe(32)
     admin_token = args.admin_token or config.get("admin_token") or secrets.token_urlsafe(32)
 
+    hash_cache = args.hash_cache or config.get("hash_cache") or HASH_CACHE_PATH
+    audit_log_dir = args.audit_log_dir or config.get("audit_log_dir") or AUDIT_LOG_DIR
+    audit_fsync = args.audit_fsync or config.get("audit_fsync") or AUDIT_FSYNC
+
     ldap_enabled = args.ldap or config.get("ldap", False)
     ldap_server = args.ldap_server or config.get("ldap_server")
     ldap_base_dn = args.ldap_base_dn or config.get("ldap_base_dn")
@@ -632,6 +2595,8 @@ def main():
     ACCESS_TOKEN = token
     ADMIN_TOKEN = admin_token
     ROOT_DIR = os.path.abspath(root)
+    HASH_CACHE.path = hash_cache
+    AUDIT_LOG.start(audit_log_dir, audit_fsync)
 
     settings = {
         "cookie_secret": ACCESS_TOKEN,
@@ -0,0 +1,341 @@
+"""Mirror a remote aird `/files/` tree into a local directory.
+
+Files that already exist locally are updated block by block: the client fetches
+the server's per-block checksums from `/api/blocks/<path>`, looks for each block
+anywhere in its own copy (rsync-style rolling checksum, so data shifted by an
+insertion is still found) and downloads only the missing blocks in one
+multi-range request.
+Only the standard library is used so the client can be copied anywhere.
+
+    python -m aird.sync http://server:8000 TOKEN ./mirror --path logs
+"""
+import os
+import re
+import sys
+import json
+import shutil
+import zlib
+import mmap
+import hashlib
+import argparse
+import tempfile
+import time
+import http.cookiejar
+import urllib.parse
+import urllib.request
+from urllib.error import HTTPError
+
+DEFAULT_BLOCK_SIZE = 128 * 1024
+MIN_BLOCK_SIZE = 4 * 1024
+MAX_BLOCK_SIZE = 16 * 1024 * 1024
+# Upper bound on the number of ranges in one request, enforced by the server too
+MAX_RANGES = 256
+COPY_SIZE = 1024 * 1024
+# How often to retry when the server answers 503 (admission limits reached)
+BUSY_RETRIES = 5
+# Bytes of a local file searched at every offset; the rolling loop is pure
+# Python, so beyond this only whole-block steps are checked
+ROLLING_SEARCH_LIMIT = 8 * 1024 * 1024
+ADLER_MOD = 65521
+
+
+def block_checksums(path, block_size=DEFAULT_BLOCK_SIZE):
+    """Return [weak, strong] checksums for each block_size block of a file.
+
+    The weak checksum is Adler-32, which find_blocks() can roll one byte at a
+    time; the strong one is a 128-bit BLAKE2b hex digest. Runs in the server's
+    process pool, so it must stay a picklable top-level function.
+    """
+    blocks = []
+    with open(path, 'rb') as f:
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            blocks.append([zlib.adler32(block), strong_checksum(block)])
+    return blocks
+
+
+def strong_checksum(block):
+    return hashlib.blake2b(block, digest_size=16).hexdigest()
+
+
+def find_blocks(path, blocks, block_size, size):
+    """Find the given blocks of a size-byte file at any offset of the file at path.
+
+    A block_size window is rolled over the local file; where its Adler-32 matches
+    a block's weak checksum the strong checksum decides, and a match moves the
+    window a whole block ahead. The short last block is only looked for at the
+    same offset and at the end of the local file. Returns {block index: offset}.
+    """
+    full_blocks = size // block_size
+    by_weak = {}
+    for i, (weak, strong) in enumerate(blocks[:full_blocks]):
+        by_weak.setdefault(weak, {}).setdefault(strong, []).append(i)
+    found = {}
+    with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        length = len(data)
+        pos, rolled, a, b = 0, 0, None, None
+        while pos + block_size <= length:
+            if a is None:
+                weak = zlib.adler32(data[pos:pos + block_size])
+                a, b = weak & 0xffff, weak >> 16
+            candidates = by_weak.get((b << 16) | a)
+            if candidates:
+                indexes = candidates.get(strong_checksum(data[pos:pos + block_size]))
+                if indexes:
+                    for i in indexes:
+                        found.setdefault(i, pos)
+                    pos += block_size
+                    a = None
+                    continue
+            if rolled >= ROLLING_SEARCH_LIMIT or pos + block_size == length:
+                pos += block_size
+                a = None
+                continue
+            # Slide the window one byte: drop data[pos], take in data[pos + block_size]
+            old, new = data[pos], data[pos + block_size]
+            a = (a - old + new) % ADLER_MOD
+            b = (b - block_size * old + a - 1) % ADLER_MOD
+            pos += 1
+            rolled += 1
+
+        last = len(blocks) - 1
+        tail = size - last * block_size
+        if last >= full_blocks and last >= 0:
+            for offset in (last * block_size, length - tail):
+                if 0 <= offset and offset + tail <= length and \
+                        strong_checksum(data[offset:offset + tail]) == blocks[last][1]:
+                    found[last] = offset
+                    break
+    return found
+
+
+def coalesce(indexes, block_size, size):
+    """Turn sorted block indexes into inclusive (start, end) byte ranges."""
+    ranges = []
+    for i in indexes:
+        start = i * block_size
+        end = min(start + block_size, size) - 1
+        if ranges and ranges[-1][1] + 1 == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+
+class SyncClient:
+    def __init__(self, base_url, token, block_size=DEFAULT_BLOCK_SIZE):
+        self.base_url = base_url.rstrip('/')
+        self.block_size = block_size
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar())
+        )
+        self.stats = {"files": 0, "skipped": 0, "bytes_total": 0, "bytes_transferred": 0}
+        self._login(token)
+
+    def _url(self, prefix, path, **query):
+        url = f"{self.base_url}{prefix}{urllib.parse.quote(path)}"
+        if query:
+            url += "?" + urllib.parse.urlencode(query)
+        return url
+
+    def _login(self, token):
+        data = urllib.parse.urlencode({"token": token}).encode()
+        with self.opener.open(f"{self.base_url}/login", data=data) as resp:
+            # A failed login renders the login page again instead of redirecting
+            if not resp.geturl().rstrip('/').endswith("/files"):
+                raise RuntimeError("Login failed: invalid token")
+
+    def _open(self, request):
+        for attempt in range(BUSY_RETRIES + 1):
+            try:
+                return self.opener.open(request)
+            except HTTPError as e:
+                if e.code != 503 or attempt == BUSY_RETRIES:
+                    raise
+                time.sleep(int(e.headers.get("Retry-After") or 1))
+
+    def _get_json(self, prefix, path, **query):
+        with self._open(self._url(prefix, path, **query)) as resp:
+            return json.load(resp)
+
+    def sync_tree(self, remote_path, local_dir, delete=False):
+        remote_path = remote_path.strip('/')
+        listing = self._get_json("/api/files/", remote_path)
+        os.makedirs(local_dir, exist_ok=True)
+        seen = set()
+        for entry in listing["files"]:
+            name = entry["name"]
+            seen.add(name)
+            child_remote = f"{remote_path}/{name}" if remote_path else name
+            child_local = os.path.join(local_dir, name)
+            if entry["is_dir"]:
+                self.sync_tree(child_remote, child_local, delete)
+            else:
+                self.sync_file(child_remote, child_local, entry)
+        if delete:
+            for name in os.listdir(local_dir):
+                if name not in seen:
+                    path = os.path.join(local_dir, name)
+                    if os.path.isdir(path):
+                        shutil.rmtree(path)
+                    else:
+                        os.remove(path)
+
+    def sync_file(self, remote_path, local_path, entry):
+        size = entry.get("size_bytes")
+        mtime = entry.get("modified_timestamp")
+        self.stats["files"] += 1
+        if os.path.isfile(local_path):
+            st = os.stat(local_path)
+            if st.st_size == size and int(st.st_mtime) == mtime:
+                self.stats["skipped"] += 1
+                self.stats["bytes_total"] += size
+                return
+        if os.path.isfile(local_path) and os.path.getsize(local_path) > 0:
+            try:
+                self._delta_sync(remote_path, local_path)
+            except (ValueError, HTTPError) as e:
+                print(f"Delta sync of {remote_path} failed ({e}), downloading it whole", file=sys.stderr)
+                self._full_download(remote_path, local_path)
+        else:
+            self._full_download(remote_path, local_path)
+        if mtime is not None:
+            os.utime(local_path, (mtime, mtime))
+
+    def _temp_for(self, local_path):
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(local_path) or ".", prefix=".aird-sync-")
+        return os.fdopen(fd, 'w+b'), tmp
+
+    def _full_download(self, remote_path, local_path):
+        out, tmp = self._temp_for(local_path)
+        try:
+            with out, self._open(self._url("/files/", remote_path, download=1)) as resp:
+                while True:
+                    chunk = resp.read(COPY_SIZE)
+                    if not chunk:
+                        break
+                    out.write(chunk)
+                    self.stats["bytes_transferred"] += len(chunk)
+            self.stats["bytes_total"] += os.path.getsize(tmp)
+            os.replace(tmp, local_path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _delta_sync(self, remote_path, local_path):
+        manifest = self._get_json("/api/blocks/", remote_path, block_size=self.block_size)
+        block_size = manifest["block_size"]
+        size = manifest["size"]
+        remote_blocks = manifest["blocks"]
+        found = find_blocks(local_path, remote_blocks, block_size, size)
+
+        out, tmp = self._temp_for(local_path)
+        try:
+            missing = []
+            with out, open(local_path, 'rb') as local:
+                for i in range(len(remote_blocks)):
+                    source = found.get(i)
+                    if source is None:
+                        missing.append(i)
+                        continue
+                    local.seek(source)
+                    out.seek(i * block_size)
+                    out.write(local.read(min(block_size, size - i * block_size)))
+                ranges = coalesce(missing, block_size, size)
+                for batch in range(0, len(ranges), MAX_RANGES):
+                    self._fetch_ranges(remote_path, ranges[batch:batch + MAX_RANGES], out)
+                out.truncate(size)
+                out.flush()
+                self._verify(out, missing, remote_blocks, block_size)
+            self.stats["bytes_total"] += size
+            os.replace(tmp, local_path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    def _verify(self, out, indexes, remote_blocks, block_size):
+        """Check the fetched blocks, in case the file changed since the manifest was made."""
+        for i in indexes:
+            out.seek(i * block_size)
+            if strong_checksum(out.read(block_size)) != remote_blocks[i][1]:
+                raise ValueError(f"block {i} does not match the manifest")
+
+    def _fetch_ranges(self, remote_path, ranges, out):
+        spec = ",".join(f"{start}-{end}" for start, end in ranges)
+        request = urllib.request.Request(
+            self._url("/files/", remote_path, download=1),
+            headers={"Range": f"bytes={spec}"},
+        )
+        with self._open(request) as resp:
+            if resp.status != 206:
+                raise ValueError("server did not return partial content")
+            content_type = resp.headers.get("Content-Type", "")
+            if content_type.startswith("multipart/byteranges"):
+                boundary = content_type.split("boundary=", 1)[1].strip('"').encode()
+                self._read_multipart(resp, boundary, out)
+            else:
+                start, end = self._content_range(resp.headers.get("Content-Range", ""))
+                self._copy_part(resp, start, end, out)
+
+    def _read_multipart(self, resp, boundary, out):
+        delimiter = b"--" + boundary
+        while True:
+            line = resp.readline()
+            if not line:
+                raise ValueError("truncated multipart response")
+            line = line.strip()
+            if line == delimiter + b"--":
+                return
+            if line != delimiter:
+                continue
+            headers = {}
+            while True:
+                header = resp.readline().strip()
+                if not header:
+                    break
+                name, _, value = header.decode('latin-1').partition(":")
+                headers[name.strip().lower()] = value.strip()
+            start, end = self._content_range(headers.get("content-range", ""))
+            self._copy_part(resp, start, end, out)
+
+    def _copy_part(self, resp, start, end, out):
+        out.seek(start)
+        remaining = end - start + 1
+        while remaining:
+            chunk = resp.read(min(remaining, COPY_SIZE))
+            if not chunk:
+                raise ValueError("truncated range response")
+            out.write(chunk)
+            remaining -= len(chunk)
+            self.stats["bytes_transferred"] += len(chunk)
+
+    @staticmethod
+    def _content_range(value):
+        match = re.match(r"bytes (\d+)-(\d+)/", value)
+        if not match:
+            raise ValueError(f"bad Content-Range: {value!r}")
+        return int(match.group(1)), int(match.group(2))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mirror an aird directory tree locally")
+    parser.add_argument("url", help="Base URL of the aird server, e.g. http://host:8000")
+    parser.add_argument("token", help="Access token for login")
+    parser.add_argument("dest", help="Local directory to sync into")
+    parser.add_argument("--path", default="", help="Remote directory under /files/ to mirror")
+    parser.add_argument("--block-size", type=int, default=DEFAULT_BLOCK_SIZE, help="Block size in bytes")
+    parser.add_argument("--delete", action="store_true", help="Delete local files missing on the server")
+    args = parser.parse_args()
+
+    client = SyncClient(args.url, args.token, args.block_size)
+    client.sync_tree(args.path, args.dest, delete=args.delete)
+    stats = client.stats
+    print(
+        f"Synced {stats['files']} files ({stats['skipped']} unchanged): "
+        f"transferred {stats['bytes_transferred']} of {stats['bytes_total']} bytes"
+    )
+
+if __name__ == "__main__":
+    main()
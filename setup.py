@@ -18,6 +18,7 @@ setup(
     entry_points={
         'console_scripts': [
             'aird=aird.main:main',
+            'aird-sync=aird.sync:main',
         ],
     },
     install_requires=parse_requirements('requirements.txt'),
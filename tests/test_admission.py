@@ -0,0 +1,132 @@
+import asyncio
+
+import pytest
+
+from aird.main import AdmissionController, AdmissionRejected
+
+
+def limits(**overrides):
+    values = {
+        "total": 0,
+        "interactive_reserve": 0,
+        "queue_size": 10,
+        "queue_timeout": 5,
+        "listing_per_user": 0,
+        "listing_global": 0,
+        "download_per_user": 0,
+        "download_global": 0,
+        "upload_per_user": 0,
+        "upload_global": 0,
+    }
+    values.update(overrides)
+    return values
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_admits_within_limits_and_counts():
+    async def scenario():
+        controller = AdmissionController(limits(download_per_user=2))
+        await controller.acquire("download", "alice")
+        await controller.acquire("download", "alice")
+        await controller.acquire("download", "bob")
+        assert controller.active["download"] == 3
+        assert controller.active_users[("download", "alice")] == 2
+        controller.release("download", "alice")
+        assert controller.total == 2
+    run(scenario())
+
+
+def test_waiter_is_admitted_when_a_slot_frees():
+    async def scenario():
+        controller = AdmissionController(limits(download_per_user=1))
+        await controller.acquire("download", "alice")
+        waiter = asyncio.ensure_future(controller.acquire("download", "alice"))
+        await asyncio.sleep(0)
+        assert not waiter.done()
+        controller.release("download", "alice")
+        await waiter
+        assert controller.active_users[("download", "alice")] == 1
+    run(scenario())
+
+
+def test_higher_priority_classes_are_woken_first():
+    async def scenario():
+        controller = AdmissionController(limits(total=1))
+        await controller.acquire("download", "a")
+        order = []
+
+        async def acquire(kind):
+            await controller.acquire(kind, kind)
+            order.append(kind)
+
+        download = asyncio.ensure_future(acquire("download"))
+        await asyncio.sleep(0)
+        listing = asyncio.ensure_future(acquire("listing"))
+        await asyncio.sleep(0)
+        controller.release("download", "a")
+        await listing
+        assert order == ["listing"]
+        controller.release("listing", "listing")
+        await download
+        assert order == ["listing", "download"]
+    run(scenario())
+
+
+def test_full_queue_rejects():
+    async def scenario():
+        controller = AdmissionController(limits(download_global=1, queue_size=1))
+        await controller.acquire("download", "a")
+        waiter = asyncio.ensure_future(controller.acquire("download", "b"))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("download", "c")
+        assert controller.stats["download"]["rejected"] == 1
+        controller.release("download", "a")
+        await waiter
+    run(scenario())
+
+
+def test_queue_size_zero_means_unlimited():
+    async def scenario():
+        controller = AdmissionController(limits(download_global=1, queue_size=0))
+        await controller.acquire("download", "a")
+        waiters = [asyncio.ensure_future(controller.acquire("download", str(i))) for i in range(5)]
+        await asyncio.sleep(0)
+        assert len(controller.waiters) == 5
+        for i in range(5):
+            controller.release("download", "a" if i == 0 else str(i - 1))
+            await asyncio.sleep(0)
+        await asyncio.gather(*waiters)
+    run(scenario())
+
+
+def test_queue_timeout_rejects_and_leaves_the_queue():
+    async def scenario():
+        controller = AdmissionController(limits(download_global=1, queue_timeout=0.05))
+        await controller.acquire("download", "a")
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("download", "b")
+        assert controller.waiters == []
+        assert controller.active["download"] == 1
+    run(scenario())
+
+
+def test_interactive_reserve_is_kept_from_bulk_classes():
+    async def scenario():
+        controller = AdmissionController(limits(total=2, interactive_reserve=1, queue_timeout=0.05))
+        await controller.acquire("download", "a")
+        with pytest.raises(AdmissionRejected):
+            await controller.acquire("download", "b")
+        # Listings may still use the reserved slot
+        await controller.acquire("listing", "b")
+    run(scenario())
+
+
+def test_validate():
+    assert AdmissionController.validate(limits(total=10, interactive_reserve=2)) is None
+    assert AdmissionController.validate(limits(total=0, interactive_reserve=5)) is None
+    assert AdmissionController.validate(limits(total=2, interactive_reserve=2))
+    assert AdmissionController.validate(limits(total=2, interactive_reserve=3))
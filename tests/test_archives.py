@@ -0,0 +1,142 @@
+import asyncio
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+
+from aird import main
+from aird.main import (
+    ArchiveIndexCache,
+    build_archive_index,
+    list_archive_directory,
+    open_archive_member,
+    read_archive_text,
+    split_archive_path,
+)
+
+
+def make_zip(path, members):
+    with zipfile.ZipFile(path, "w") as zf:
+        for name, data in members.items():
+            zf.writestr(name, data)
+    return str(path)
+
+
+def make_tar(path, members, mode="w"):
+    with tarfile.open(path, mode) as tf:
+        for name, data in members.items():
+            if data is None:
+                info = tarfile.TarInfo(name)
+                info.type = tarfile.DIRTYPE
+                tf.addfile(info)
+                continue
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tf.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def read_member(index, member):
+    with open_archive_member(index, member) as f:
+        return f.read()
+
+
+def test_zip_index_implies_parent_directories(tmp_path):
+    path = make_zip(tmp_path / "a.zip", {"top.txt": b"top", "a/b/c.txt": b"deep"})
+    index = build_archive_index(path)
+    index["zip"].close()
+    assert sorted(index["members"]) == ["a", "a/b", "a/b/c.txt", "top.txt"]
+    assert index["members"]["a"]["is_dir"]
+    assert index["members"]["a/b"]["info"] is None
+    assert index["children"] == {"": {"a", "top.txt"}, "a": {"b"}, "a/b": {"c.txt"}}
+
+
+def test_tar_index_normalises_names(tmp_path):
+    path = make_tar(tmp_path / "a.tar", {
+        ".": None, "./dir": None, "./dir/f.txt": b"x", "/abs.txt": b"y", "./empty/": None,
+    })
+    index = build_archive_index(path)
+    assert sorted(index["members"]) == ["abs.txt", "dir", "dir/f.txt", "empty"]
+    assert index["children"] == {"": {"abs.txt", "dir", "empty"}, "dir": {"f.txt"}, "empty": set()}
+    assert [f["name"] for f in list_archive_directory(index, "dir")] == ["f.txt"]
+    assert list_archive_directory(index, "empty") == []
+
+
+def test_split_archive_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ROOT_DIR", str(tmp_path))
+    archive = make_zip(tmp_path / "logs.zip", {"a/b.txt": b""})
+    (tmp_path / "plain.txt").write_text("")
+    (tmp_path / "dir").mkdir()
+
+    assert split_archive_path(archive) == (archive, "")
+    assert split_archive_path(archive + "/a/b.txt") == (archive, "a/b.txt")
+    assert split_archive_path(archive + "/a") == (archive, "a")
+    assert split_archive_path(str(tmp_path / "plain.txt" / "x")) == (None, None)
+    assert split_archive_path(str(tmp_path / "dir" / "missing")) == (None, None)
+    assert split_archive_path(str(tmp_path / "missing.zip" / "x")) == (None, None)
+
+
+@pytest.mark.parametrize("name,mode", [("a.tar", "w"), ("a.tar.gz", "w:gz"), ("a.tar.xz", "w:xz")])
+def test_tar_member_reads(tmp_path, name, mode):
+    path = make_tar(tmp_path / name, {"first.txt": b"first", "dir/second.txt": b"second\n" * 1000}, mode)
+    index = build_archive_index(path)
+    assert read_member(index, "first.txt") == b"first"
+    assert read_member(index, "dir/second.txt") == b"second\n" * 1000
+
+
+def test_zip_member_reads(tmp_path):
+    path = make_zip(tmp_path / "a.zip", {"first.txt": b"first", "dir/second.txt": b"second"})
+    index = build_archive_index(path)
+    assert read_member(index, "first.txt") == b"first"
+    assert read_member(index, "dir/second.txt") == b"second"
+    index["zip"].close()
+
+
+def test_read_archive_text(tmp_path, monkeypatch):
+    path = make_tar(tmp_path / "a.tar", {"log.txt": b"info one\nerror two\ninfo three\n"})
+    index = build_archive_index(path)
+    assert read_archive_text(open_archive_member(index, "log.txt"), "error") == "error two\n"
+    monkeypatch.setattr(main, "MAX_READABLE_FILE_SIZE", 8)
+    assert read_archive_text(open_archive_member(index, "log.txt")).startswith("info one\n[... truncated")
+
+
+def test_index_cache_hits_and_invalidates(tmp_path):
+    path = make_tar(tmp_path / "a.tar", {"a.txt": b"a"})
+
+    async def scenario():
+        cache = ArchiveIndexCache()
+        first = await cache.get(path)
+        cache.release(first)
+        assert await cache.get(path) is first
+        cache.release(first)
+        make_tar(tmp_path / "a.tar", {"b.txt": b"bb"})
+        second = await cache.get(path)
+        cache.release(second)
+        assert second is not first
+        assert first["evicted"]
+        assert list(cache.entries) == [(path,) + main.file_identity(os.stat(path))]
+        return second
+
+    assert sorted(asyncio.run(scenario())["members"]) == ["b.txt"]
+
+
+def test_evicted_zip_stays_open_while_in_use(tmp_path):
+    first_path = make_zip(tmp_path / "a.zip", {"a.txt": b"a"})
+    second_path = make_zip(tmp_path / "b.zip", {"b.txt": b"b"})
+
+    async def scenario():
+        cache = ArchiveIndexCache(size=1)
+        first = await cache.get(first_path)
+        second = await cache.get(second_path)
+        # Evicted, but a request still holds it
+        assert first["evicted"]
+        assert read_member(first, "a.txt") == b"a"
+        cache.release(first)
+        assert first["zip"].fp is None
+        cache.release(second)
+        assert second["zip"].fp is not None
+        second["zip"].close()
+
+    asyncio.run(scenario())
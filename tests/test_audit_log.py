@@ -0,0 +1,147 @@
+import json
+import os
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from aird import main
+from aird.main import AuditLog
+
+
+def handler(user="alice"):
+    return SimpleNamespace(get_current_user=lambda: user, request=SimpleNamespace(remote_ip="127.0.0.1"))
+
+
+def wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def read_events(directory, name="audit.jsonl"):
+    with open(os.path.join(directory, name)) as f:
+        return [json.loads(line) for line in f]
+
+
+@pytest.fixture
+def fsyncs(monkeypatch):
+    calls = []
+    real_fsync = os.fsync
+    def fsync(fd):
+        calls.append(fd)
+        real_fsync(fd)
+    monkeypatch.setattr(os, "fsync", fsync)
+    return calls
+
+
+@pytest.fixture
+def audit(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "AUDIT_FLUSH_INTERVAL", 60)
+    log = AuditLog()
+    yield log
+    log.close()
+
+
+def test_events_are_indexed_without_a_writer(audit):
+    audit.record(handler(), "upload", "a.txt", size=3, hash=None)
+    assert not audit.queue
+    assert audit.query() == [{
+        "time": audit.recent[0]["time"],
+        "user": "alice",
+        "ip": "127.0.0.1",
+        "action": "upload",
+        "path": "a.txt",
+        "size": 3,
+    }]
+
+
+def test_query(audit):
+    audit.record(handler("alice"), "upload", "docs/a.txt")
+    audit.record(handler("bob"), "download", "docs/a.txt")
+    audit.record(handler("alice"), "delete", "tmp/b.txt")
+    audit.record(handler(b"alice"), "download", "docs/c.txt")
+
+    assert [e["path"] for e in audit.query(user="alice")] == ["docs/c.txt", "tmp/b.txt", "docs/a.txt"]
+    assert [e["user"] for e in audit.query(action="download")] == ["alice", "bob"]
+    assert [e["path"] for e in audit.query(user="alice", action="download")] == ["docs/c.txt"]
+    assert [e["path"] for e in audit.query(path="docs/")] == ["docs/c.txt", "docs/a.txt", "docs/a.txt"]
+    assert len(audit.query(limit=2)) == 2
+    assert audit.query(user="nobody") == []
+
+
+def test_full_batches_are_written_at_once(audit, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "AUDIT_BATCH_SIZE", 3)
+    audit.start(str(tmp_path), fsync="never")
+    for i in range(3):
+        audit.record(handler(), "download", f"{i}.txt")
+    wait_for(lambda: audit.written == 3)
+    audit.record(handler(), "download", "3.txt")
+    time.sleep(0.1)
+    # A partial batch waits for the next one or the flush interval
+    assert audit.written == 3
+    assert [e["path"] for e in read_events(tmp_path)] == ["0.txt", "1.txt", "2.txt"]
+    audit.close()
+    assert [e["path"] for e in read_events(tmp_path)] == ["0.txt", "1.txt", "2.txt", "3.txt"]
+    assert audit.stats() == {"queued": 0, "written": 4, "dropped": 0}
+
+
+def test_full_queue_drops_events(audit, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "AUDIT_QUEUE_SIZE", 2)
+    audit.start(str(tmp_path), fsync="never")
+    for i in range(5):
+        audit.record(handler(), "download", f"{i}.txt")
+    assert audit.stats() == {"queued": 2, "written": 0, "dropped": 3}
+    # Dropped events are still queryable, only not persisted
+    assert len(audit.query()) == 5
+    audit.close()
+    assert len(read_events(tmp_path)) == 2
+
+
+def test_rotation_keeps_backup_count_files(audit, tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "AUDIT_BATCH_SIZE", 1)
+    monkeypatch.setattr(main, "AUDIT_MAX_BYTES", 300)
+    monkeypatch.setattr(main, "AUDIT_BACKUP_COUNT", 2)
+    audit.start(str(tmp_path), fsync="never")
+    for i in range(20):
+        audit.record(handler(), "download", f"{i}.txt")
+    audit.close()
+    rotated = sorted(name for name in os.listdir(tmp_path) if name != "audit.jsonl")
+    assert len(rotated) == 2
+    assert all(name.startswith("audit-") and name.endswith(".jsonl") for name in rotated)
+    # The newest backups and the current file hold the most recent events
+    paths = [e["path"] for name in rotated + ["audit.jsonl"] for e in read_events(tmp_path, name)]
+    assert paths == [f"{i}.txt" for i in range(20 - len(paths), 20)]
+
+
+def test_fsync_always(audit, tmp_path, monkeypatch, fsyncs):
+    monkeypatch.setattr(main, "AUDIT_BATCH_SIZE", 1)
+    audit.start(str(tmp_path), fsync="always")
+    audit.record(handler(), "download", "a.txt")
+    audit.record(handler(), "download", "b.txt")
+    wait_for(lambda: audit.written == 2)
+    assert len(fsyncs) == 2
+
+
+def test_fsync_interval_syncs_late_writes_without_new_events(audit, tmp_path, monkeypatch, fsyncs):
+    monkeypatch.setattr(main, "AUDIT_BATCH_SIZE", 1)
+    monkeypatch.setattr(main, "AUDIT_FSYNC_INTERVAL", 0.5)
+    audit.start(str(tmp_path), fsync="interval")
+    audit.record(handler(), "download", "a.txt")
+    wait_for(lambda: len(fsyncs) == 1)
+    audit.record(handler(), "download", "b.txt")
+    wait_for(lambda: audit.written == 2)
+    # Written within the interval: synced once it is due, not at the next event
+    assert len(fsyncs) == 1
+    wait_for(lambda: not audit._unsynced)
+    assert len(fsyncs) == 2
+
+
+def test_fsync_never(audit, tmp_path, monkeypatch, fsyncs):
+    monkeypatch.setattr(main, "AUDIT_BATCH_SIZE", 1)
+    audit.start(str(tmp_path), fsync="never")
+    audit.record(handler(), "download", "a.txt")
+    wait_for(lambda: audit.written == 1)
+    time.sleep(0.1)
+    assert fsyncs == []
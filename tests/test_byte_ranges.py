@@ -0,0 +1,42 @@
+from aird.main import parse_byte_ranges
+
+SIZE = 100
+
+
+def test_absent_or_other_unit_serves_whole_file():
+    assert parse_byte_ranges(None, SIZE) is None
+    assert parse_byte_ranges("", SIZE) is None
+    assert parse_byte_ranges("items=0-10", SIZE) is None
+
+
+def test_single_ranges():
+    assert parse_byte_ranges("bytes=0-9", SIZE) == [(0, 9)]
+    assert parse_byte_ranges("bytes=90-", SIZE) == [(90, 99)]
+    assert parse_byte_ranges("bytes=-10", SIZE) == [(90, 99)]
+    # The end is clamped to the file size
+    assert parse_byte_ranges("bytes=95-200", SIZE) == [(95, 99)]
+    assert parse_byte_ranges("bytes=-500", SIZE) == [(0, 99)]
+
+
+def test_multiple_ranges_are_sorted_and_merged():
+    assert parse_byte_ranges("bytes=50-59, 0-9", SIZE) == [(0, 9), (50, 59)]
+    assert parse_byte_ranges("bytes=0-9,10-19,15-30", SIZE) == [(0, 30)]
+
+
+def test_invalid_syntax_is_ignored():
+    # RFC 9110: an invalid Range header is ignored, not answered with 416
+    for header in ("bytes=5-3", "bytes=0-9,5-3", "bytes=-", "bytes=a-b", "bytes=+1-2", "bytes=1-2-3", "bytes=10"):
+        assert parse_byte_ranges(header, SIZE) is None, header
+
+
+def test_unsatisfiable_ranges():
+    assert parse_byte_ranges("bytes=100-", SIZE) == []
+    assert parse_byte_ranges("bytes=200-300", SIZE) == []
+    assert parse_byte_ranges("bytes=-0", SIZE) == []
+    # Satisfiable ranges are kept when others are not
+    assert parse_byte_ranges("bytes=200-300,0-0", SIZE) == [(0, 0)]
+
+
+def test_empty_file():
+    assert parse_byte_ranges("bytes=0-", 0) == []
+    assert parse_byte_ranges("bytes=-10", 0) == []
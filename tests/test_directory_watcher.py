@@ -0,0 +1,205 @@
+import asyncio
+import os
+
+import pytest
+
+from aird import main
+from aird.main import DirectoryWatcher, Inotify
+
+
+class Recorder:
+    def __init__(self):
+        self.deltas = []
+        self.removed = []
+
+    def on_directory_change(self, abspath, delta):
+        self.deltas.append((abspath, delta))
+
+    def on_directory_removed(self, abspath):
+        self.removed.append(abspath)
+
+
+class Failing(Recorder):
+    def on_directory_change(self, abspath, delta):
+        raise RuntimeError("broken subscriber")
+
+
+class FakeInotify:
+    """Hands out one descriptor per real directory, like the kernel does."""
+    available = True
+
+    def __init__(self):
+        self.wds = {}
+        self.removed = []
+        self.events = []
+
+    def add_watch(self, path):
+        return self.wds.setdefault(os.path.realpath(path), len(self.wds) + 1)
+
+    def rm_watch(self, wd):
+        self.removed.append(wd)
+
+    def read_events(self):
+        events, self.events = self.events, []
+        return events
+
+
+class NoInotify:
+    available = False
+
+
+def names(delta):
+    return [entry["name"] for entry in delta["upserts"]], delta["removes"]
+
+
+@pytest.fixture(autouse=True)
+def fast_timers(monkeypatch):
+    monkeypatch.setattr(main, "WATCH_DEBOUNCE", 0.05)
+    monkeypatch.setattr(main, "WATCH_POLL_INTERVAL", 0.05)
+
+
+@pytest.mark.skipif(not Inotify().available, reason="inotify is not available")
+def test_inotify_bursts_are_coalesced(tmp_path):
+    (tmp_path / "gone").write_text("x")
+
+    async def scenario():
+        watcher = DirectoryWatcher()
+        recorder = Recorder()
+        watcher.subscribe(str(tmp_path), recorder)
+        for i in range(20):
+            (tmp_path / "new").write_text(str(i))
+        (tmp_path / "temp").write_text("x")
+        (tmp_path / "temp").unlink()
+        (tmp_path / "gone").unlink()
+        await asyncio.sleep(0.3)
+        watcher.unsubscribe(str(tmp_path), recorder)
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert len(recorder.deltas) == 1
+    abspath, delta = recorder.deltas[0]
+    assert abspath == str(tmp_path)
+    assert names(delta) == (["new"], ["gone", "temp"])
+
+
+def test_polling_fallback(tmp_path):
+    (tmp_path / "old").write_text("x")
+
+    async def scenario():
+        watcher = DirectoryWatcher()
+        watcher.inotify = NoInotify()
+        recorder = Recorder()
+        watcher.subscribe(str(tmp_path), recorder)
+        (tmp_path / "new").write_text("x")
+        (tmp_path / "old").unlink()
+        await asyncio.sleep(0.3)
+        # Unchanged scans report nothing
+        assert len(recorder.deltas) == 1
+        (tmp_path / "new").write_text("longer")
+        await asyncio.sleep(0.3)
+        assert len(recorder.deltas) == 2
+
+        subdir = tmp_path / "sub"
+        subdir.mkdir()
+        watcher.subscribe(str(subdir), recorder)
+        subdir.rmdir()
+        await asyncio.sleep(0.3)
+        watcher.unsubscribe(str(tmp_path), recorder)
+        assert watcher.watches == {}
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert names(recorder.deltas[0][1]) == (["new"], ["old"])
+    assert names(recorder.deltas[1][1]) == (["new"], [])
+    assert recorder.removed == [str(tmp_path / "sub")]
+
+
+def test_queue_overflow_resyncs_every_watch(tmp_path):
+    (tmp_path / "a").mkdir()
+    (tmp_path / "b").mkdir()
+
+    async def scenario():
+        watcher = DirectoryWatcher()
+        watcher.inotify = fake = FakeInotify()
+        recorder = Recorder()
+        for name in ("a", "b"):
+            watcher.subscribe(str(tmp_path / name), recorder)
+        (tmp_path / "a" / "f").write_text("x")
+        fake.events = [(fake.wds[str(tmp_path / "a")], Inotify.IN_CREATE, "f"), (-1, Inotify.IN_Q_OVERFLOW, "")]
+        watcher._on_inotify(None, None)
+        await asyncio.sleep(0.2)
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    # The pending delta is superseded by the resync
+    assert sorted(recorder.deltas) == [
+        (str(tmp_path / "a"), {"type": "resync"}),
+        (str(tmp_path / "b"), {"type": "resync"}),
+    ]
+
+
+def test_paths_to_one_directory_share_its_descriptor(tmp_path):
+    real = tmp_path / "real"
+    real.mkdir()
+    os.symlink(real, tmp_path / "link")
+    real_path, link_path = str(real), str(tmp_path / "link")
+
+    async def scenario():
+        watcher = DirectoryWatcher()
+        watcher.inotify = fake = FakeInotify()
+        first, second = Recorder(), Recorder()
+        watcher.subscribe(real_path, first)
+        watcher.subscribe(link_path, second)
+        wd = fake.wds[real_path]
+        assert watcher.by_wd == {wd: {real_path, link_path}}
+
+        (real / "f").write_text("x")
+        fake.events = [(wd, Inotify.IN_CREATE, "f")]
+        watcher._on_inotify(None, None)
+        await asyncio.sleep(0.2)
+        assert names(first.deltas[0][1]) == names(second.deltas[0][1]) == (["f"], [])
+
+        watcher.unsubscribe(real_path, first)
+        # Still in use through the symlink
+        assert fake.removed == []
+        watcher.unsubscribe(link_path, second)
+        assert fake.removed == [wd]
+        assert watcher.by_wd == {}
+
+    asyncio.run(scenario())
+
+
+def test_removed_directory_notifies_every_path(tmp_path):
+    real = tmp_path / "real"
+    real.mkdir()
+    os.symlink(real, tmp_path / "link")
+
+    async def scenario():
+        watcher = DirectoryWatcher()
+        watcher.inotify = fake = FakeInotify()
+        recorder = Recorder()
+        watcher.subscribe(str(real), recorder)
+        watcher.subscribe(str(tmp_path / "link"), recorder)
+        fake.events = [(fake.wds[str(real)], Inotify.IN_DELETE_SELF, "")]
+        watcher._on_inotify(None, None)
+        assert watcher.watches == {}
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert sorted(recorder.removed) == [str(tmp_path / "link"), str(tmp_path / "real")]
+
+
+def test_failing_subscriber_does_not_stop_the_others(tmp_path):
+    async def scenario():
+        watcher = DirectoryWatcher()
+        watcher.inotify = fake = FakeInotify()
+        recorder = Recorder()
+        watcher.subscribe(str(tmp_path), Failing())
+        watcher.subscribe(str(tmp_path), recorder)
+        fake.events = [(fake.wds[str(tmp_path)], Inotify.IN_CREATE, "f")]
+        watcher._on_inotify(None, None)
+        await asyncio.sleep(0.2)
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    assert names(recorder.deltas[0][1]) == ([], ["f"])
@@ -0,0 +1,118 @@
+import gzip
+import os
+
+from aird import main
+from aird.main import FileTail, read_last_lines
+
+
+def append(path, text):
+    with open(path, "a") as f:
+        f.write(text)
+
+
+def test_starts_at_the_end(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("old\n")
+    tail = FileTail(str(path))
+    assert tail.read_lines() == b""
+    append(path, "one\ntwo\n")
+    assert tail.read_lines() == b"one\ntwo\n"
+    tail.close()
+
+
+def test_from_start_and_offset(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("a\nb\n")
+    assert FileTail(str(path), from_start=True).read_lines() == b"a\nb\n"
+    assert FileTail(str(path), offset=2).read_lines() == b"b\n"
+
+
+def test_partial_lines_wait_for_their_newline(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("")
+    tail = FileTail(str(path))
+    append(path, "one\ntw")
+    assert tail.read_lines() == b"one\n"
+    assert tail.read_lines() == b""
+    append(path, "o\n")
+    assert tail.read_lines() == b"two\n"
+
+
+def test_follows_rename_rotation(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("")
+    tail = FileTail(str(path))
+    append(path, "before\n")
+    os.rename(path, str(path) + ".1")
+    # Not recreated yet: the old file is still read
+    append(str(path) + ".1", "late\nunterminated")
+    assert tail.read_lines() == b"before\nlate\n"
+    path.write_text("new\n")
+    assert tail.read_lines() == b"unterminated\nnew\n"
+    append(path, "more\n")
+    assert tail.read_lines() == b"more\n"
+
+
+def test_rotation_without_follow_stops_at_old_end(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("")
+    tail = FileTail(str(path), follow=False)
+    identity = tail.identity
+    append(path, "last\n")
+    os.rename(path, str(path) + ".1")
+    path.write_text("new\n")
+    assert tail.read_lines() == b"last\n"
+    assert tail.rotated
+    assert tail.identity == identity
+    assert tail.file.tell() == len("last\n")
+
+
+def test_copytruncate_restarts_from_the_beginning(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("a long first line\n")
+    tail = FileTail(str(path))
+    path.write_text("x\n")
+    assert tail.read_lines() == b"x\n"
+
+
+def test_failed_reopen_keeps_the_old_handle(tmp_path):
+    path = tmp_path / "app.log"
+    path.write_text("")
+    tail = FileTail(str(path))
+    os.rename(path, str(path) + ".1")
+    os.mkdir(path)
+    append(str(path) + ".1", "still here\n")
+    assert tail.read_lines() == b"still here\n"
+    assert not tail.file.closed
+    os.rmdir(path)
+    path.write_text("new\n")
+    assert tail.read_lines() == b"new\n"
+
+
+def test_reads_are_capped(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "TAIL_READ_LIMIT", 8)
+    path = tmp_path / "app.log"
+    path.write_text("")
+    tail = FileTail(str(path))
+    append(path, "1234\n5678\nabc\n")
+    assert tail.read_lines() == b"1234\n"
+    assert tail.more
+    chunks = []
+    while tail.more:
+        chunks.append(tail.read_lines())
+    assert b"".join(chunks) == b"5678\nabc\n"
+
+
+def test_read_last_lines(tmp_path, monkeypatch):
+    path = tmp_path / "app.log"
+    path.write_text("".join(f"line {i}\n" for i in range(1000)))
+    # Small blocks so the backwards reading crosses block boundaries
+    monkeypatch.setattr(main, "CHUNK_SIZE", 16)
+    assert read_last_lines(str(path), 3) == ["line 997", "line 998", "line 999"]
+    assert read_last_lines(str(path), 0) == []
+    assert len(read_last_lines(str(path), 5000)) == 1000
+
+    compressed = tmp_path / "old.log.gz"
+    with gzip.open(compressed, "wt") as f:
+        f.write("a\nb\nc\n")
+    assert read_last_lines(str(compressed), 2) == ["b", "c"]
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from aird import main
+from aird.main import HashCache, link_or_copy, replace_file
+
+
+@pytest.fixture
+def cache(tmp_path, monkeypatch):
+    root = tmp_path / "root"
+    root.mkdir()
+    monkeypatch.setattr(main, "ROOT_DIR", str(root))
+    return HashCache(str(tmp_path / "cache" / "hashes.sqlite3"))
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_get_hashes_once_and_caches(cache, tmp_path, monkeypatch):
+    path = write(tmp_path / "root" / "a", b"hello")
+    assert cache.get_cached(path) is None
+    digest = asyncio.run(cache.get(path))
+    assert digest == hashlib.sha256(b"hello").hexdigest()
+    assert cache.get_cached(path) == digest
+
+    # A hit never reaches the pool
+    monkeypatch.setattr(cache, "_compute", None)
+    assert asyncio.run(cache.get(path)) == digest
+
+
+def test_changed_file_is_a_miss(cache, tmp_path):
+    path = write(tmp_path / "root" / "a", b"hello")
+    asyncio.run(cache.get(path))
+    write(tmp_path / "root" / "a", b"hello, world")
+    assert cache.get_cached(path) is None
+    assert asyncio.run(cache.get(path)) == hashlib.sha256(b"hello, world").hexdigest()
+
+
+def test_find_returns_existing_copies(cache, tmp_path):
+    path = write(tmp_path / "root" / "a", b"hello")
+    digest = asyncio.run(cache.get(path))
+    assert cache.find(digest) == path
+    assert cache.find(digest, size=5) == path
+    assert cache.find(digest, size=6) is None
+    assert cache.find(hashlib.sha256(b"other").hexdigest()) is None
+
+
+def test_find_prunes_stale_rows(cache, tmp_path):
+    path = write(tmp_path / "root" / "a", b"hello")
+    digest = asyncio.run(cache.get(path))
+    cache.record_write(path)
+    os.remove(path)
+    assert cache.find(digest) is None
+    db = cache._conn()
+    assert db.execute("SELECT COUNT(*) FROM hashes").fetchone()[0] == 0
+    assert db.execute("SELECT COUNT(*) FROM written").fetchone()[0] == 0
+
+
+def test_find_ignores_files_outside_root(cache, tmp_path):
+    path = write(tmp_path / "outside", b"hello")
+    digest = asyncio.run(cache.get(path))
+    assert cache.find(digest) is None
+    # The row is still valid, only not served
+    assert cache.get_cached(path) == digest
+
+
+def test_own_writes(cache, tmp_path):
+    path = write(tmp_path / "root" / "a", b"hello")
+    assert not cache.is_own_write(path)
+    cache.record_write(path)
+    assert cache.is_own_write(path)
+    with open(path, "ab") as f:
+        f.write(b" again")
+    assert not cache.is_own_write(path)
+    assert not cache.is_own_write(str(tmp_path / "root" / "missing"))
+
+
+def test_replace_file_keeps_hardlinks_intact(tmp_path):
+    path = write(tmp_path / "a", b"old")
+    os.chmod(path, 0o640)
+    os.link(path, tmp_path / "b")
+    replace_file(path, b"new")
+    assert (tmp_path / "a").read_bytes() == b"new"
+    assert (tmp_path / "b").read_bytes() == b"old"
+    assert os.stat(path).st_mode & 0o777 == 0o640
+    assert sorted(os.listdir(tmp_path)) == ["a", "b"]
+
+
+def test_replace_file_creates_missing_files(tmp_path):
+    replace_file(str(tmp_path / "new"), b"data")
+    assert (tmp_path / "new").read_bytes() == b"data"
+
+
+def test_link_or_copy(tmp_path):
+    source = write(tmp_path / "source", b"data")
+    assert link_or_copy(source, str(tmp_path / "linked")) == "hardlink"
+    assert os.path.samefile(source, tmp_path / "linked")
+
+    assert link_or_copy(source, str(tmp_path / "copied"), allow_link=False) == "copy"
+    assert not os.path.samefile(source, tmp_path / "copied")
+    assert (tmp_path / "copied").read_bytes() == b"data"
+
+
+def test_link_or_copy_replaces_the_target(tmp_path):
+    source = write(tmp_path / "source", b"data")
+    target = write(tmp_path / "target", b"previous")
+    assert link_or_copy(source, target) == "hardlink"
+    assert (tmp_path / "target").read_bytes() == b"data"
+    assert sorted(os.listdir(tmp_path)) == ["source", "target"]
+
+
+def test_link_or_copy_falls_back_to_copying(tmp_path, monkeypatch):
+    def cross_device(source, target):
+        raise OSError(18, "Invalid cross-device link")
+    monkeypatch.setattr(os, "link", cross_device)
+    source = write(tmp_path / "source", b"data")
+    assert link_or_copy(source, str(tmp_path / "target")) == "copy"
+    assert (tmp_path / "target").read_bytes() == b"data"
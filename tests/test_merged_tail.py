@@ -0,0 +1,172 @@
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+from unittest import mock
+
+import pytest
+from tornado.httpclient import HTTPRequest
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.websocket import websocket_connect
+
+from aird import main
+from aird.main import MergedTailSocketHandler, parse_line_timestamp
+
+
+def test_parse_line_timestamp():
+    base = datetime(2024, 5, 1, 12, 30, 15).timestamp()
+    assert parse_line_timestamp("2024-05-01 12:30:15 started") == base
+    assert parse_line_timestamp("2024-05-01T12:30:15.5Z done") == base + 0.5
+    assert parse_line_timestamp("2024-05-01 12:30:15,123 INFO x") == pytest.approx(base + 0.123)
+    assert parse_line_timestamp("[INFO] [2024-05-01 12:30:15] x") == base
+
+
+def test_parse_line_timestamp_without_a_stamp():
+    assert parse_line_timestamp("no time here") is None
+    assert parse_line_timestamp("2024-13-01 12:30:15 bad month") is None
+    # Only the start of a line is searched
+    assert parse_line_timestamp("x" * 80 + " 2024-05-01 12:30:15") is None
+
+
+@pytest.fixture
+def handler(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "ROOT_DIR", str(tmp_path))
+    monkeypatch.setattr(main, "MULTI_TAIL_REORDER_WINDOW", 1.0)
+    # Only the buffering state, no connection
+    handler = MergedTailSocketHandler.__new__(MergedTailSocketHandler)
+    handler.ws_connection = object()
+    handler.buffer = []
+    handler.last_ts = {}
+    handler.seq = iter(range(1000))
+    handler.sent = []
+    handler.write_message = lambda message: handler.sent.extend(json.loads(message)["lines"])
+    return handler
+
+
+def test_flush_orders_lines_by_timestamp(handler, tmp_path):
+    a, b = str(tmp_path / "a.log"), str(tmp_path / "b.log")
+    old = time.monotonic() - 5
+    handler._buffer_line(a, "2024-05-01 12:00:02 a2", old)
+    handler._buffer_line(a, "  continued", old)
+    handler._buffer_line(b, "2024-05-01 12:00:01 b1", old)
+    handler._buffer_line(b, "2024-05-01 12:00:03 b3", old)
+    handler._flush()
+    assert [(line["source"], line["line"]) for line in handler.sent] == [
+        ("b.log", "2024-05-01 12:00:01 b1"),
+        ("a.log", "2024-05-01 12:00:02 a2"),
+        # Lines without a stamp keep the previous one of their file
+        ("a.log", "  continued"),
+        ("b.log", "2024-05-01 12:00:03 b3"),
+    ]
+
+
+def test_flush_holds_recent_lines_for_the_reorder_window(handler, tmp_path):
+    a, b = str(tmp_path / "a.log"), str(tmp_path / "b.log")
+    handler._buffer_line(a, "2024-05-01 12:00:02 a2", time.monotonic() - 5)
+    handler._buffer_line(b, "2024-05-01 12:00:03 b3", time.monotonic())
+    handler._flush()
+    assert [line["line"] for line in handler.sent] == ["2024-05-01 12:00:02 a2"]
+    # A late line from another file still comes out in order
+    handler._buffer_line(a, "2024-05-01 12:00:01 a1", time.monotonic())
+    handler._flush(force=True)
+    assert [line["line"] for line in handler.sent[1:]] == ["2024-05-01 12:00:01 a1", "2024-05-01 12:00:03 b3"]
+
+
+class MergedTailTest(AsyncHTTPTestCase):
+    def get_app(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "logs", "a"))
+        self.write("logs/a/app.log", "history\n")
+        patcher = mock.patch.multiple(
+            main,
+            ROOT_DIR=self.root,
+            ACCESS_TOKEN="token",
+            WATCH_DEBOUNCE=0.05,
+            MULTI_TAIL_REORDER_WINDOW=0.1,
+            DIRECTORY_WATCHER=main.DirectoryWatcher(),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return main.make_app({"cookie_secret": "secret", "login_url": "/login"})
+
+    def write(self, path, text, mode="a"):
+        with open(os.path.join(self.root, path), mode) as f:
+            f.write(text)
+
+    async def connect(self, query):
+        response = await self.http_client.fetch(
+            self.get_url("/login"), method="POST", body="token=token", follow_redirects=False, raise_error=False
+        )
+        cookie = response.headers["Set-Cookie"].split(";")[0]
+        url = self.get_url(f"/tail/ws?{query}").replace("http", "ws", 1)
+        self.ws = await websocket_connect(HTTPRequest(url, headers={"Cookie": cookie}))
+        self.lines = []
+        self.files = None
+
+    async def receive(self, count, timeout=3):
+        """Collect messages until count lines were sent in total."""
+        deadline = time.monotonic() + timeout
+        while len(self.lines) < count:
+            message = await asyncio.wait_for(self.ws.read_message(), deadline - time.monotonic())
+            assert message is not None, "stream closed"
+            message = json.loads(message)
+            if message["type"] == "files":
+                self.files = message["files"]
+            elif message["type"] == "lines":
+                self.lines.extend((line["source"], line["line"]) for line in message["lines"])
+        return self.lines
+
+    @gen_test(timeout=10)
+    async def test_history_and_new_lines(self):
+        await self.connect("glob=logs/*/*.log")
+        assert await self.receive(1) == [("logs/a/app.log", "history")]
+        assert self.files == ["logs/a/app.log"]
+        self.write("logs/a/app.log", "live\n")
+        assert (await self.receive(2))[1:] == [("logs/a/app.log", "live")]
+
+    @gen_test(timeout=10)
+    async def test_rotation_hands_off_without_duplicates(self):
+        await self.connect("glob=logs/a/*.log*")
+        await self.receive(1)
+        path = os.path.join(self.root, "logs", "a", "app.log")
+        with open(path, "a", buffering=1) as writer:
+            writer.write("before\n")
+            await self.receive(2)
+            os.rename(path, path + ".1")
+            # Still written by the old writer, now under its new name
+            writer.write("after rename\n")
+            await self.receive(3)
+            self.write("logs/a/app.log", "new file\n", mode="w")
+            await self.receive(4)
+            writer.write("late\n")
+            await self.receive(5)
+        await asyncio.sleep(0.3)
+        assert sorted(self.lines[1:]) == sorted([
+            ("logs/a/app.log", "before"),
+            ("logs/a/app.log", "after rename"),
+            ("logs/a/app.log", "new file"),
+            ("logs/a/app.log.1", "late"),
+        ])
+        assert self.files == ["logs/a/app.log", "logs/a/app.log.1"]
+
+    @gen_test(timeout=10)
+    async def test_recursive_globs_find_new_subdirectories(self):
+        await self.connect("glob=logs/**/*.log")
+        await self.receive(1)
+        os.makedirs(os.path.join(self.root, "logs", "b", "c"))
+        await asyncio.sleep(0.3)
+        self.write("logs/b/c/deep.log", "deep\n")
+        assert (await self.receive(2))[1:] == [("logs/b/c/deep.log", "deep")]
+        # Removing a watched subdirectory does not end the stream
+        os.remove(os.path.join(self.root, "logs", "b", "c", "deep.log"))
+        os.removedirs(os.path.join(self.root, "logs", "b", "c"))
+        await asyncio.sleep(0.3)
+        self.write("logs/a/app.log", "still here\n")
+        assert (await self.receive(3))[2:] == [("logs/a/app.log", "still here")]
+
+    def tearDown(self):
+        if getattr(self, "ws", None) is not None:
+            self.ws.close()
+        super().tearDown()
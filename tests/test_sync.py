@@ -0,0 +1,134 @@
+import io
+import os
+import zlib
+
+import pytest
+
+from aird import sync
+from aird.sync import SyncClient, block_checksums, coalesce, find_blocks
+
+
+def make_client():
+    # Skip __init__, which logs in to a server
+    client = SyncClient.__new__(SyncClient)
+    client.stats = {"files": 0, "skipped": 0, "bytes_total": 0, "bytes_transferred": 0}
+    return client
+
+
+def test_coalesce_merges_adjacent_blocks():
+    assert coalesce([], 10, 100) == []
+    assert coalesce([0, 1, 2], 10, 100) == [(0, 29)]
+    assert coalesce([0, 2, 3, 7], 10, 100) == [(0, 9), (20, 39), (70, 79)]
+
+
+def test_coalesce_clamps_the_last_block():
+    assert coalesce([9], 10, 95) == [(90, 94)]
+    assert coalesce([8, 9], 10, 95) == [(80, 94)]
+
+
+def test_read_multipart_writes_each_part_at_its_offset():
+    body = (
+        b"\r\n--sep\r\n"
+        b"Content-Type: application/octet-stream\r\n"
+        b"Content-Range: bytes 2-4/10\r\n\r\n"
+        b"cde"
+        b"\r\n--sep\r\n"
+        b"Content-Type: application/octet-stream\r\n"
+        b"Content-Range: bytes 7-8/10\r\n\r\n"
+        b"hi"
+        b"\r\n--sep--\r\n"
+    )
+    out = io.BytesIO(b"." * 10)
+    client = make_client()
+    client._read_multipart(io.BytesIO(body), b"sep", out)
+    assert out.getvalue() == b"..cde..hi."
+    assert client.stats["bytes_transferred"] == 5
+
+
+def test_read_multipart_part_may_contain_newlines():
+    body = (
+        b"--sep\r\nContent-Range: bytes 0-5/6\r\n\r\n"
+        b"a\r\nb\nc"
+        b"\r\n--sep--\r\n"
+    )
+    out = io.BytesIO()
+    make_client()._read_multipart(io.BytesIO(body), b"sep", out)
+    assert out.getvalue() == b"a\r\nb\nc"
+
+
+def test_read_multipart_rejects_truncated_responses():
+    out = io.BytesIO()
+    with pytest.raises(ValueError):
+        make_client()._read_multipart(io.BytesIO(b"--sep\r\nContent-Range: bytes 0-9/10\r\n\r\nabc"), b"sep", out)
+    with pytest.raises(ValueError):
+        make_client()._read_multipart(io.BytesIO(b"--sep\r\n"), b"sep", io.BytesIO())
+
+
+def test_read_multipart_rejects_bad_content_range():
+    body = b"--sep\r\nContent-Range: items 0-1\r\n\r\nab\r\n--sep--\r\n"
+    with pytest.raises(ValueError):
+        make_client()._read_multipart(io.BytesIO(body), b"sep", io.BytesIO())
+
+
+def write(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def assert_found(local, remote, block_size, found):
+    for i, offset in found.items():
+        length = min(block_size, len(remote) - i * block_size)
+        assert local[offset:offset + length] == remote[i * block_size:i * block_size + length]
+
+
+def test_find_blocks_after_insertion(tmp_path):
+    block_size = 1024
+    local = os.urandom(20 * block_size + 100)
+    remote = local[:5000] + b"inserted" + local[5000:]
+    local_path = write(tmp_path, "local", local)
+    blocks = block_checksums(write(tmp_path, "remote", remote), block_size)
+
+    found = find_blocks(local_path, blocks, block_size, len(remote))
+    assert_found(local, remote, block_size, found)
+    # Only the block holding the insertion is missing, the shifted ones are found
+    assert set(range(len(blocks))) - set(found) == {4}
+
+
+def test_find_blocks_unchanged_and_unrelated_files(tmp_path):
+    block_size = 512
+    data = os.urandom(10 * block_size + 7)
+    path = write(tmp_path, "same", data)
+    blocks = block_checksums(path, block_size)
+    assert find_blocks(path, blocks, block_size, len(data)) == {
+        i: i * block_size for i in range(len(blocks))
+    }
+
+    other = write(tmp_path, "other", os.urandom(len(data)))
+    assert find_blocks(other, blocks, block_size, len(data)) == {}
+
+
+def test_find_blocks_shifted_data_needs_rolling(tmp_path, monkeypatch):
+    block_size = 256
+    local = os.urandom(8 * block_size)
+    remote = b"x" + local
+    local_path = write(tmp_path, "local", local)
+    blocks = block_checksums(write(tmp_path, "remote", remote), block_size)
+    found = find_blocks(local_path, blocks, block_size, len(remote))
+    assert_found(local, remote, block_size, found)
+    assert set(range(1, len(blocks))) <= set(found)
+
+    # With the rolling limit at 0 only whole-block steps are tried, which finds
+    # none of the shifted full blocks (the short last one is checked separately)
+    monkeypatch.setattr(sync, "ROLLING_SEARCH_LIMIT", 0)
+    found = find_blocks(local_path, blocks, block_size, len(remote))
+    assert set(found) == {len(blocks) - 1}
+
+
+def test_block_checksums(tmp_path):
+    data = b"a" * 10 + b"b" * 5
+    blocks = block_checksums(write(tmp_path, "f", data), 10)
+    assert blocks == [
+        [zlib.adler32(b"a" * 10), sync.strong_checksum(b"a" * 10)],
+        [zlib.adler32(b"b" * 5), sync.strong_checksum(b"b" * 5)],
+    ]
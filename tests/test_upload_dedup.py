@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import tempfile
+from unittest import mock
+
+from tornado.testing import AsyncHTTPTestCase
+
+from aird import main
+
+CONTENT = b"hello" * 1000
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+
+
+class UploadDedupTest(AsyncHTTPTestCase):
+    def get_app(self):
+        self.root = tempfile.mkdtemp()
+        patcher = mock.patch.multiple(
+            main,
+            ROOT_DIR=self.root,
+            ACCESS_TOKEN="token",
+            HASH_CACHE=main.HashCache(os.path.join(tempfile.mkdtemp(), "hashes.sqlite3")),
+            FEATURE_FLAGS=dict(main.FEATURE_FLAGS),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        with open(os.path.join(self.root, "a.txt"), "wb") as f:
+            f.write(CONTENT)
+        return main.make_app({"cookie_secret": "secret", "login_url": "/login"})
+
+    def setUp(self):
+        super().setUp()
+        response = self.fetch("/login", method="POST", body="token=token", follow_redirects=False)
+        self.headers = {"Cookie": response.headers["Set-Cookie"].split(";")[0]}
+
+    def hash(self, path):
+        return json.loads(self.fetch(f"/api/hash/{path}", headers=self.headers).body)["hash"]
+
+    def dedup(self, **data):
+        body = dict({"directory": "sub", "filename": "b.txt", "hash": DIGEST, "size": len(CONTENT)}, **data)
+        response = self.fetch("/upload/dedup", method="POST", headers=self.headers, body=json.dumps(body))
+        return response.code, json.loads(response.body)
+
+    def test_unknown_content_is_not_found(self):
+        self.hash("a.txt")
+        assert self.dedup(hash="0" * 64) == (404, {"deduplicated": False})
+        assert self.dedup(size=1) == (404, {"deduplicated": False})
+
+    def test_foreign_files_are_copied(self):
+        assert self.hash("a.txt") == DIGEST
+        assert self.dedup() == (200, {"deduplicated": True, "method": "copy"})
+        target = os.path.join(self.root, "sub", "b.txt")
+        with open(target, "rb") as f:
+            assert f.read() == CONTENT
+        assert not os.path.samefile(target, os.path.join(self.root, "a.txt"))
+        # The copy is aird's own, so it may be linked from now on
+        assert main.HASH_CACHE.is_own_write(target)
+
+    def test_own_writes_are_hardlinked(self):
+        source = os.path.join(self.root, "a.txt")
+        main.HASH_CACHE.record_write(source)
+        self.hash("a.txt")
+        assert self.dedup() == (200, {"deduplicated": True, "method": "hardlink"})
+        assert os.path.samefile(source, os.path.join(self.root, "sub", "b.txt"))
+
+    def test_same_path_is_existing(self):
+        self.hash("a.txt")
+        assert self.dedup(directory="", filename="a.txt") == (200, {"deduplicated": True, "method": "existing"})
+
+    def test_directory_target_conflicts(self):
+        self.hash("a.txt")
+        os.makedirs(os.path.join(self.root, "sub", "b.txt"))
+        assert self.dedup()[0] == 409
+
+    def test_forbidden(self):
+        self.hash("a.txt")
+        assert self.dedup(directory="..")[0] == 403
+        assert self.dedup(filename="../../b.txt")[0] == 403
+        main.FEATURE_FLAGS["file_upload"] = False
+        assert self.dedup()[0] == 403
+
+    def test_invalid_requests(self):
+        assert self.dedup(hash="xyz")[0] == 400
+        assert self.dedup(filename="")[0] == 400
+        assert self.dedup(algorithm="md5")[0] == 400
+
+    def test_download_etag(self):
+        response = self.fetch("/files/a.txt?download=1", headers=self.headers)
+        # Not hashed yet: no ETag, hashing is scheduled instead
+        assert response.code == 200
+        assert "Etag" not in response.headers
+        self.hash("a.txt")
+
+        response = self.fetch("/files/a.txt?download=1", headers=self.headers)
+        etag = response.headers["Etag"]
+        assert etag == f'"sha256-{DIGEST}"'
+        response = self.fetch("/files/a.txt?download=1", headers=dict(self.headers, **{"If-None-Match": etag}))
+        assert response.code == 304
+
+        with open(os.path.join(self.root, "a.txt"), "ab") as f:
+            f.write(b"changed")
+        response = self.fetch("/files/a.txt?download=1", headers=dict(self.headers, **{"If-None-Match": etag}))
+        assert response.code == 200
+        assert "Etag" not in response.headers